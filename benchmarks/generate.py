@@ -0,0 +1,90 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Synthetic TAP streams and suite trees for the benchmarks"""
+
+import os
+
+CASE = "#!/bin/sh\necho 1..1\necho ok\n"
+
+
+def generate_tap(count, diagnostic_size=10, diagnostic_every=100):
+    """Generate the lines of a TAP stream of count test lines
+
+    Mixes passing lines with SKIP and TODO directives, with a diagnostic
+    of roughly diagnostic_size characters every diagnostic_every lines."""
+    padding = "x" * max(diagnostic_size - 10, 0)
+    lines = ["1.." + str(count) + "\n"]
+    for i in range(1, count + 1):
+        if i % diagnostic_every == 0:
+            lines.append("# progress " + str(i) + padding + "\n")
+        if i % 50 == 0:
+            lines.append("not ok " + str(i) + " - check " + str(i) +
+                         " # TODO not implemented\n")
+        elif i % 30 == 0:
+            lines.append("ok " + str(i) + " # SKIP no network\n")
+        else:
+            lines.append("ok " + str(i) + " - check " + str(i) + "\n")
+
+    return lines
+
+
+def write_tap(file, lines):
+    with open(file, 'w') as f:
+        f.writelines(lines)
+
+
+def write_case(directory):
+    """Write a trivial passing case to a directory, returning its path"""
+    case = os.path.join(directory, 'case.sh')
+    with open(case, 'w') as f:
+        f.write(CASE)
+    os.chmod(case, 0o755)
+    return case
+
+
+def generate_tree(directory, depth, width):
+    """Generate a tree of suite files below a directory
+
+    Every suite holds a case, depends on another and has width sub
+    suites, down to depth levels below the top level suite, where the
+    leaves only hold cases. Returns the top level suite file and the
+    number of suite files."""
+    write_case(directory)
+
+    level = ['top']
+    files = 0
+    for i in range(depth):
+        next_level = []
+        for name in level:
+            children = [name + '_' + str(j) for j in range(width)]
+            with open(os.path.join(directory, name + '.yaml'), 'w') as f:
+                f.write("Ordering: any\nDependencies:\n  - case.sh\n"
+                        "Tests:\n")
+                f.write("  - case.sh:\n      arguments: -n " + name + "\n")
+                for child in children:
+                    f.write("  - " + child + ".yaml\n")
+            next_level += children
+            files += 1
+        level = next_level
+
+    for name in level:
+        with open(os.path.join(directory, name + '.yaml'), 'w') as f:
+            f.write("Ordering: sequential\nTests:\n  - case.sh\n"
+                    "  - case.sh:\n      arguments: -n " + name + "\n")
+        files += 1
+
+    return (os.path.join(directory, 'top.yaml'), files)
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run the benchmarks of the hot paths and write the results as JSON
+
+Measures TAP parser throughput on plain and diagnostic heavy streams,
+suite tree parsing, scheduler overhead per trivial case, the peak memory
+of a long case and JUnit generation. The results of a previous run can
+be compared against, failing on regressions beyond a threshold."""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from mistest import suite
+from mistest.tap import Parser
+from mistest.case import Case, CaseExecutionResult
+from mistest.junit import JUnitWriter
+from mistest.scheduler import Scheduler
+from mistest.store import TapSegment
+from generate import generate_tap, write_tap, generate_tree
+
+
+class NullOutput:
+    """An output discarding all results"""
+
+    def __call__(self, result):
+        pass
+
+    def finished(self, test):
+        pass
+
+    def summarize(self, line):
+        pass
+
+
+def result(name, value, unit, better):
+    return {'name': name, 'value': value, 'unit': unit, 'better': better}
+
+
+def parse_stream(lines):
+    """Parse the lines as the output of a case, returning the time"""
+    stream = io.BytesIO("".join(lines).encode('utf-8'))
+    parser = Parser()
+    start = time.perf_counter()
+    for tap in parser(stream):
+        pass
+    return time.perf_counter() - start
+
+
+def bench_parser(args, directory):
+    lines = generate_tap(args.lines)
+    elapsed = parse_stream(lines)
+    yield result('parser', len(lines) / elapsed, 'lines/s', 'higher')
+
+
+def bench_diagnostics(args, directory):
+    lines = generate_tap(args.diagnostic_lines, args.diagnostic_size, 10)
+    size = sum(len(line) for line in lines)
+    elapsed = parse_stream(lines)
+    yield result('diagnostics', size / elapsed / 2 ** 20, 'MiB/s', 'higher')
+
+
+def bench_suite_parse(args, directory):
+    (top, files) = generate_tree(directory, args.depth, args.width)
+    start = time.perf_counter()
+    suite.parse_yaml_suite(top, None, 1)
+    elapsed = time.perf_counter() - start
+    yield result('suite parse', elapsed, 's', 'lower')
+    yield result('suite parse per file', elapsed / files * 1000, 'ms',
+                 'lower')
+
+
+def bench_scheduler(args, directory):
+    top = suite.Suite("top")
+    for i in range(args.cases):
+        top.append_test(Case("/bin/echo", top, i + 1,
+                             arguments=['-en', "1..1\nok\n"]))
+
+    resources = ['local' + str(i) for i in range(args.jobs)]
+    start = time.perf_counter()
+    Scheduler(resources, top, NullOutput())()
+    elapsed = time.perf_counter() - start
+
+    # Time spent in the cases is not overhead, spawning them included
+    busy = sum(result.duration for case in top.test_list
+               for result in case.execution_results)
+    overhead = (elapsed * len(resources) - busy) / args.cases
+    yield result('scheduler per case', elapsed / args.cases * 1000, 'ms',
+                 'lower')
+    yield result('scheduler overhead per case', overhead * 1000, 'ms',
+                 'lower')
+
+
+def run_case_traced(file):
+    """Run a case printing a file, returning the peak memory"""
+    case = Case("/bin/cat", None, 1, arguments=[file])
+    tracemalloc.start()
+    for tap in case(Parser(), "local"):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_memory(args, directory):
+    file = os.path.join(directory, 'memory.tap')
+    lines = generate_tap(args.memory_lines)
+    write_tap(file, lines)
+
+    peak = run_case_traced(file)
+    yield result('memory peak per line', peak / len(lines), 'bytes', 'lower')
+
+    segment = TapSegment(args.resident, directory)
+    CaseExecutionResult.tap_segment = segment
+    try:
+        peak = run_case_traced(file)
+    finally:
+        CaseExecutionResult.tap_segment = None
+        segment.close()
+    yield result('spilled memory peak per line', peak / len(lines), 'bytes',
+                 'lower')
+
+
+def bench_junit(args, directory):
+    file = os.path.join(directory, 'junit.tap')
+    write_tap(file, generate_tap(args.junit_lines))
+
+    top = suite.Suite("top")
+    parser = Parser()
+    for i in range(args.junit_cases):
+        case = Case("/bin/cat", top, i + 1, arguments=[file])
+        top.append_test(case)
+        for tap in case(parser, "local"):
+            pass
+
+    start = time.perf_counter()
+    writer = JUnitWriter(os.path.join(directory, 'junit.xml'), top)
+    for case in top.test_list:
+        writer.finished(case)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    yield result('junit', elapsed, 's', 'lower')
+
+
+benchmarks = {
+    'parser': bench_parser,
+    'diagnostics': bench_diagnostics,
+    'suite-parse': bench_suite_parse,
+    'scheduler': bench_scheduler,
+    'memory': bench_memory,
+    'junit': bench_junit,
+}
+
+
+def commit():
+    """The git commit of the tree measured, if known"""
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=root, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.decode().strip()
+
+
+def compare(previous, results, threshold):
+    """Compare results with those of a previous run, returning report
+    lines and whether any result regressed beyond the threshold"""
+    before = {entry['name']: entry for entry in previous['results']}
+    lines = ["Compared with " + str(previous.get('commit')) + ":"]
+    regressed = False
+
+    for entry in results:
+        old = before.get(entry['name'])
+        if old is None or not old['value']:
+            continue
+
+        change = entry['value'] / old['value'] - 1
+        worse = -change if entry['better'] == 'higher' else change
+        flag = ""
+        if worse > threshold:
+            flag = " REGRESSION"
+            regressed = True
+
+        lines.append("  %-30s %12.4g -> %12.4g %-7s %+6.1f%%%s" %
+                     (entry['name'], old['value'], entry['value'],
+                      entry['unit'], change * 100, flag))
+
+    return (lines, regressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--only', action='append', choices=benchmarks,
+                        help='Run only this benchmark, may be repeated')
+    parser.add_argument('--output', '-o', help='Write the JSON results to \
+                        this file instead of standard output')
+    parser.add_argument('--compare', help='Compare with the JSON results \
+                        of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative change counted as a regression')
+    parser.add_argument('--lines', type=int, default=1000000,
+                        help='Number of test lines of the parser benchmark')
+    parser.add_argument('--diagnostic-lines', type=int, default=20000,
+                        help='Number of test lines of the diagnostics \
+                        benchmark, with a diagnostic every ten lines')
+    parser.add_argument('--diagnostic-size', type=int, default=16384,
+                        help='Number of characters of each diagnostic')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Number of levels of sub suites in the tree')
+    parser.add_argument('--width', type=int, default=16,
+                        help='Number of sub suites in each suite')
+    parser.add_argument('--cases', type=int, default=500,
+                        help='Number of trivial cases scheduled')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of resources running the cases')
+    parser.add_argument('--memory-lines', type=int, default=200000,
+                        help='Number of test lines of the memory benchmark')
+    parser.add_argument('--resident', type=int, default=1000,
+                        help='Number of lines kept in memory when spilling')
+    parser.add_argument('--junit-cases', type=int, default=100,
+                        help='Number of cases of the JUnit benchmark')
+    parser.add_argument('--junit-lines', type=int, default=1000,
+                        help='Number of test lines of each JUnit case')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.only or benchmarks:
+            print("running " + name, file=sys.stderr)
+            bench_directory = os.path.join(directory, name)
+            os.mkdir(bench_directory)
+            for entry in benchmarks[name](args, bench_directory):
+                print("  %-30s %12.4g %s" % (entry['name'], entry['value'],
+                                             entry['unit']), file=sys.stderr)
+                results.append(entry)
+
+    report = {
+        'commit': commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'parameters': {key: value for (key, value) in vars(args).items()
+                       if key not in ('only', 'output', 'compare')},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        (lines, regressed) = compare(previous, results, args.threshold)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the time to parse a large generated suite tree
+
+Generates a tree of nested suite files, each with a few cases and
+dependencies, and parses it with the pure python and the libyaml
+loaders, loading sibling suites one at a time and concurrently in
+worker processes. The CPU time of the parsing process shows the work
+left to it, which bounds the time taken given a CPU per worker."""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import yaml
+from mistest import suite
+from generate import generate_tree
+
+
+def measure(top, loader, workers):
+    suite.yaml_loader = loader
+    suite.load_workers = workers
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    suite.parse_yaml_suite(top, None, 1)
+    elapsed = (time.perf_counter() - start, time.process_time() - cpu_start)
+    suite.close_load_pool()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Number of levels of sub suites in the tree')
+    parser.add_argument('--width', type=int, default=16,
+                        help='Number of sub suites in each suite')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of processes loading sibling suites')
+    args = parser.parse_args()
+
+    loaders = [('python', yaml.SafeLoader)]
+    if hasattr(yaml, 'CSafeLoader'):
+        loaders.append(('libyaml', yaml.CSafeLoader))
+
+    with tempfile.TemporaryDirectory() as directory:
+        (top, files) = generate_tree(directory, args.depth, args.width)
+
+        print("parsing %d files:" % files)
+        for (name, loader) in loaders:
+            for workers in [1, args.workers]:
+                (elapsed, cpu) = measure(top, loader, workers)
+                print("  %-8s %2d workers: %8.3f s, %8.3f s CPU" %
+                      (name, workers, elapsed, cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the memory held per parsed TAP record
+
+Parses a synthetic stream of test lines, directives and diagnostics and
+reports the bytes allocated per record, kept in a list and in a TapStore
+holding a limited number of records in memory."""
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mistest.tap import Parser
+from mistest.store import TapSegment
+from generate import generate_tap
+
+
+def measure(lines, taps):
+    """Parse the lines into taps, returning the bytes held per record"""
+    parser = Parser()(None)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for line in lines:
+        taps.append(parser.parse_line(line))
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held / len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', '-n', type=int, default=100000,
+                        help='Number of test lines to parse')
+    parser.add_argument('--resident', type=int, default=1000,
+                        help='Number of records the TapStore keeps in memory')
+    args = parser.parse_args()
+
+    lines = generate_tap(args.lines)
+
+    in_list = measure(lines, [])
+
+    segment = TapSegment(args.resident)
+    in_store = measure(lines, segment.store())
+    segment.close()
+
+    print("list:      %8.1f bytes/record" % in_list)
+    print("TapStore:  %8.1f bytes/record" % in_store)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure TAP parser throughput in lines per second
+
+Compares the full ply grammar with the fast path recognizer on a
+synthetic stream of plans, test lines, directives and diagnostics."""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mistest.tap import Parser
+from generate import generate_tap
+
+
+def measure(parse, lines):
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', '-n', type=int, default=100000,
+                        help='Number of test lines to parse')
+    args = parser.parse_args()
+
+    lines = generate_tap(args.lines)
+
+    tap_parser = Parser()
+    tap_parser(None)
+    grammar = measure(tap_parser.parse_grammar, lines)
+
+    tap_parser(None)
+    fast = measure(tap_parser.parse_line, lines)
+
+    print("grammar:   %12.0f lines/s" % grammar)
+    print("fast path: %12.0f lines/s" % fast)
+    print("speedup:   %12.1fx" % (fast / grammar))
+
+
+if __name__ == '__main__':
+    main()
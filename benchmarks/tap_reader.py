@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure TAP ingestion throughput from a case pipe
+
+Runs a synthetic case printing a large number of test lines and parses
+its output, reading the pipe either line by line or in blocks."""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mistest.tap import Parser, LineReader
+
+CASE = """
+import sys
+count = int(sys.argv[1])
+line = "ok %d - synthetic test line\\n"
+sys.stdout.write("1..%d\\n" % count)
+for block in range(1, count + 1, 1000):
+    end = min(block + 1000, count + 1)
+    sys.stdout.write("".join([line % i for i in range(block, end)]))
+"""
+
+
+def run_case(count, ingest):
+    popen = subprocess.Popen([sys.executable, '-c', CASE, str(count)],
+                             stdout=subprocess.PIPE)
+    start = time.perf_counter()
+    ingest(Parser(), popen.stdout)
+    elapsed = time.perf_counter() - start
+    popen.stdout.close()
+    popen.wait()
+    return (count + 1) / elapsed
+
+
+def read_line_by_line(parser, stream):
+    for line in stream:
+        try:
+            line = line.decode("utf-8")
+        except:
+            pass
+
+
+def read_blocks(parser, stream):
+    for lines in LineReader(stream):
+        pass
+
+
+def parse_line_by_line(parser, stream):
+    parser(stream)
+    for line in stream:
+        try:
+            line = line.decode("utf-8")
+        except:
+            pass
+        yield parser.parse_line(line)
+
+    parser.check_complete()
+
+
+def line_by_line(parser, stream):
+    for tap in parse_line_by_line(parser, stream):
+        pass
+
+
+def blocks(parser, stream):
+    for tap in parser(stream):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', '-n', type=int, default=1000000,
+                        help='Number of test lines printed by the case')
+    args = parser.parse_args()
+
+    for (name, per_line, per_block) in [
+            ('read', read_line_by_line, read_blocks),
+            ('read and parse', line_by_line, blocks)]:
+        per_line = run_case(args.lines, per_line)
+        per_block = run_case(args.lines, per_block)
+
+        print(name + ":")
+        print("  line by line: %12.0f lines/s" % per_line)
+        print("  blocks:       %12.0f lines/s" % per_block)
+        print("  speedup:      %12.1fx" % (per_block / per_line))
+
+
+if __name__ == '__main__':
+    main()
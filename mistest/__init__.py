@@ -14,16 +14,51 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
+# Startup is timed from the import of the package
+started = time.perf_counter()
+
 import argparse
+import importlib
 import sys
-from .case import Case, looks_like_a_case
-from .suite import Suite, looks_like_a_suite, parse_yaml_suite
-from .scheduler import Scheduler
-from .output import Output
 import logging
+from . import timing
+from .timing import PhaseTimer
+
+# Modules are imported only once needed, a run only pays for the engine,
+# the scheduler and the features it uses.
+
+# Execution engines selectable with --engine, as module and class
+engines = {
+    'thread': ('executor', 'Executor'),
+    'asyncio': ('engine', 'AsyncExecutor'),
+}
+
+# Schedulers selectable with --schedule, as module and class
+schedulers = {
+    'simple': ('scheduler', 'Scheduler'),
+    'longest-first': ('scheduler', 'LongestFirstScheduler'),
+    'work-stealing': ('scheduler', 'WorkStealingScheduler'),
+}
+
+# The history used for longest first scheduling unless given
+default_history = '.mistest_history.json'
+
+# The time spent in each phase of starting a run
+startup_timer = None
+
+
+def load(module_and_class):
+    """Import a class of the package given as module and class name"""
+    (module, name) = module_and_class
+    return getattr(importlib.import_module('.' + module, __name__), name)
 
 
 def parse_separated(resources_and_tests):
+    from .suite import Suite, looks_like_a_suite, parse_yaml_suite
+    from .case import looks_like_a_case
+
     top_level_suite = Suite(name="Top level suite")
     resources = resources_and_tests[0:resources_and_tests.index('-')]
     sequence = 1
@@ -46,6 +81,9 @@ def parse_separated(resources_and_tests):
 
 
 def parse_unseparated(resources_and_tests):
+    from .suite import Suite, looks_like_a_suite, parse_yaml_suite
+    from .case import Case, looks_like_a_case
+
     top_level_suite = Suite(name="Top level suite")
     resources = []
     sequence = 1
@@ -79,10 +117,15 @@ def parse_unseparated(resources_and_tests):
 
 
 def parse_mistest_args(argv):
+    global startup_timer
+
+    startup_timer = PhaseTimer(started)
+    startup_timer.mark('package import')
 
     parser = argparse.ArgumentParser(description='Execute a mistest run.')
 
-    parser.add_argument('resource', nargs='*', help='A test resource.')
+    parser.add_argument('resource', nargs='*', help='A test resource, a name \
+                        for a local resource or agent://host:port')
     parser.add_argument('separator', nargs='?', metavar='-',
                         choices=['-'], help='Resource and test separator')
     parser.add_argument('test', nargs='+', help='A suite or test case.')
@@ -94,21 +137,140 @@ def parse_mistest_args(argv):
                         default=1, help='Number of parallel local jobs to run')
     parser.add_argument('--debug', '-d', help='Enable debug logging',
                         action='store_true')
+    parser.add_argument('--engine', choices=sorted(engines.keys()),
+                        default='thread', help='Execution engine, a thread \
+                        per resource or a single asyncio event loop')
+    parser.add_argument('--timeout', type=float,
+                        help='Default timeout in seconds for test cases')
+    parser.add_argument('--idle-timeout', type=float,
+                        help='Default time in seconds a test case may \
+                        run without output')
+    parser.add_argument('--schedule', choices=sorted(schedulers.keys()),
+                        default='simple', help='Scheduling algorithm')
+    parser.add_argument('--history', help='Record test case durations in \
+                        this file, used for longest-first scheduling')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='Parse TAP in this number of worker processes')
+    parser.add_argument('--cache', help='Replay the results of unchanged \
+                        passing test cases from this directory')
+    parser.add_argument('--rerun', action='store_true', help='Run all test \
+                        cases, only storing their results in the cache')
+    parser.add_argument('--cache-size', type=float, help='Evict the least \
+                        recently used results beyond this many megabytes')
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help='Load sibling suite files in this number of \
+                        processes, for large suite trees')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Report the time spent importing, parsing \
+                        and starting executors before the first test')
+    parser.add_argument('--profile', action='store_true', help='Report \
+                        the time spent in each phase of the run, on each \
+                        resource and in the slowest test cases')
+    parser.add_argument('--profile-top', type=int, default=10,
+                        help='Number of slowest test cases in the profile')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Add the peak memory use of each top level \
+                        phase, such as suite parsing or the run, to the \
+                        profile, slowing the run down. Phases within the \
+                        run overlap and get no peaks of their own')
+    parser.add_argument('--profile-json', help='Write the raw profile to \
+                        this JSON file')
+    parser.add_argument('--plan-cache', help='Load the parsed suites from \
+                        this file while no suite or case has changed')
+    parser.add_argument('--repeat', type=int, default=1, help='Run every \
+                        test this many times, spread over all resources')
+    parser.add_argument('--max-failures', type=int, help='Stop repeating \
+                        a test once this many of its runs failed')
+    parser.add_argument('--metrics-file', help='Rewrite the live metrics \
+                        of the run to this JSON file')
+    parser.add_argument('--metrics-port', type=int, help='Serve the live \
+                        metrics of the run as JSON over HTTP on this \
+                        local port, 0 for any free port')
+    parser.add_argument('--metrics-interval', type=float, default=5.0,
+                        help='Seconds between rewrites of the metrics file')
+    parser.add_argument('--max-resident-lines', type=int, help='Keep at \
+                        most this many TAP lines in memory, spilling the \
+                        rest to a temporary file')
+    parser.add_argument('--spill-dir', help='Directory of the temporary \
+                        file of --max-resident-lines')
+    parser.add_argument('--agent-token-file', help='Send the shared token \
+                        in this file to agent:// resources, as required by \
+                        agents listening on TCP')
 
     args = parser.parse_args(argv[1:])
+    startup_timer.mark('argument parsing')
+
+    if args.parse_workers and args.engine != 'thread':
+        parser.error('--parse-workers requires the thread engine')
+
+    if (args.rerun or args.cache_size) and not args.cache:
+        parser.error('--rerun and --cache-size require --cache')
+
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    if args.max_failures is not None and args.max_failures < 1:
+        parser.error('--max-failures must be at least 1')
+
+    if args.metrics_interval <= 0:
+        parser.error('--metrics-interval must be positive')
+
+    if args.spill_dir and args.max_resident_lines is None:
+        parser.error('--spill-dir requires --max-resident-lines')
+
+    if args.profile_top < 0:
+        parser.error('--profile-top must not be negative')
+
+    if args.profile or args.profile_json:
+        timing.profile = timing.Profile(args.profile_top)
+        if args.profile_memory:
+            startup_timer.trace_memory()
+    elif args.profile_memory:
+        parser.error('--profile-memory requires --profile or --profile-json')
+
+    from . import suite
+    from .case import Case
+    from .output import Output
+    startup_timer.mark('module imports')
+
+    # Timeouts for cases which do not set their own
+    Case.default_timeout = args.timeout
+    Case.default_idle_timeout = args.idle_timeout
 
     # Enable debug logging if set
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
 
+    suite.load_workers = args.load_workers
+
     # The resource/suite division is a fake, python will accumulate all values
     # but the last in resource, so post-parsing is needed.
     resources_and_tests = args.resource + args.test
 
-    if '-' in resources_and_tests:
-        (resources, top_level_suite) = parse_separated(resources_and_tests)
+    plan = None
+    if args.plan_cache:
+        from .plan import PlanCache
+        plan_cache = PlanCache(args.plan_cache)
+        plan = plan_cache.load(resources_and_tests)
+
+    if plan:
+        (resources, top_level_suite) = plan
     else:
-        (resources, top_level_suite) = parse_unseparated(resources_and_tests)
+        if '-' in resources_and_tests:
+            (resources, top_level_suite) = \
+                parse_separated(resources_and_tests)
+        else:
+            (resources, top_level_suite) = \
+                parse_unseparated(resources_and_tests)
+        suite.close_load_pool()
+
+        if args.plan_cache:
+            plan_cache.save(resources_and_tests, resources, top_level_suite)
+
+    # The anonymous top level suite repeats all tests
+    top_level_suite.repeat = args.repeat
+
+    startup_timer.mark('suite parsing')
 
     output = Output()
 
@@ -126,6 +288,15 @@ def parse_mistest_args(argv):
     if len(resources) < 1:
         resources.append("local")
 
+    # Only the thread engine runs cases on agents
+    from . import remote
+    if any(remote.is_agent(resource) for resource in resources) and \
+            args.engine != 'thread':
+        parser.error('agent:// resources require the thread engine')
+
+    if args.agent_token_file:
+        remote.token = remote.read_token(args.agent_token_file)
+
     #
     # Output
     #
@@ -139,11 +310,101 @@ def parse_mistest_args(argv):
     if args.immediate_output:
         output.set_immediate(True)
 
-    return (resources, top_level_suite, output)
+    return (resources, top_level_suite, output, args)
 
 def main():
-    (resources, top_level_suite, output) = parse_mistest_args(sys.argv)
-    scheduler = Scheduler(resources, top_level_suite, output)
-    scheduler()
-    result = top_level_suite.generate_result()
-    output.postprocess(result)
+    (resources, top_level_suite, output, args) = parse_mistest_args(sys.argv)
+    executor_class = load(engines[args.engine])
+
+    pool = None
+    if args.parse_workers:
+        from .pool import ParserPool
+        pool = ParserPool(args.parse_workers)
+
+        def executor_class(resource, result_queue):
+            return load(engines['thread'])(resource, result_queue,
+                                           pool.parser())
+
+    history = None
+    if args.history or args.schedule == 'longest-first':
+        from .history import DurationHistory
+        history = DurationHistory(args.history or default_history)
+
+    cache = None
+    if args.cache:
+        from .cache import ResultCache
+        from .case import Case
+        max_size = None
+        if args.cache_size:
+            max_size = int(args.cache_size * 1024 * 1024)
+        cache = ResultCache(args.cache, max_size, args.rerun)
+        Case.result_cache = cache
+
+    segment = None
+    if args.max_resident_lines is not None:
+        from .store import TapSegment
+        from .case import CaseExecutionResult
+        segment = TapSegment(args.max_resident_lines, args.spill_dir)
+        CaseExecutionResult.tap_segment = segment
+
+    scheduler_class = load(schedulers[args.schedule])
+    scheduler_class.max_failures = args.max_failures
+    scheduler = scheduler_class(resources, top_level_suite, output,
+                                executor_class, history)
+    publisher = None
+    if args.metrics_file or args.metrics_port is not None:
+        from .metrics import RunMetrics, MetricsPublisher
+        scheduler.metrics = RunMetrics(scheduler)
+        publisher = MetricsPublisher(scheduler.metrics, args.metrics_file,
+                                     args.metrics_port, args.metrics_interval)
+        publisher.start()
+        if publisher.server:
+            print("# Metrics at http://127.0.0.1:%d/" % publisher.port,
+                  file=sys.stderr)
+
+    startup_timer.mark('executor start')
+
+    output.start(top_level_suite)
+
+    # However the run ends, what was output so far is written out
+    try:
+        if args.startup_profile:
+            for line in startup_timer.report("Startup profile"):
+                print("# " + line, file=sys.stderr)
+
+        scheduler()
+        startup_timer.mark('run')
+
+        if publisher:
+            publisher.stop()
+
+        from .scheduler import repetition_summary
+        for line in repetition_summary(top_level_suite):
+            output.summarize(line)
+
+        if history:
+            history.save()
+
+        if cache:
+            cache.evict()
+            output.summarize(cache.summary())
+
+        if pool:
+            pool.shutdown()
+
+        result = top_level_suite.generate_result()
+        output.postprocess(result)
+    finally:
+        output.close()
+
+    startup_timer.mark('report')
+
+    if args.profile:
+        for line in timing.profile.report(startup_timer):
+            print("# " + line, file=sys.stderr)
+
+    if args.profile_json:
+        timing.profile.save(args.profile_json, startup_timer)
+
+    if segment:
+        segment.close()
@@ -0,0 +1,212 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import logging
+from .remote import (header, frame, read_token, RUN, OUTPUT, EXIT, KILL,
+                     AUTH)
+
+
+class Agent:
+    """A mistest agent
+
+    Listens on a TCP or Unix socket for cases to run, running each case
+    it receives and streaming its stdout back over the connection. A
+    connection carries any number of concurrently running cases. Anyone
+    who can connect can run any command, so given a token the agent
+    closes every connection not starting with it, and Unix sockets are
+    only accessible to their owner.
+
+    Parameters
+    ----------
+    address : A (host, port) tuple or the path of a Unix socket.
+    token : The shared token required of connections, bytes, or None.
+    """
+
+    # The longest token accepted
+    max_token = 4096
+
+    def __init__(self, address, token=None):
+        self.address = address
+        self.token = token
+        self.ready = threading.Event()
+
+    async def serve(self):
+        if isinstance(self.address, str):
+            self.server = await asyncio.start_unix_server(self.handle,
+                                                          self.address)
+            os.chmod(self.address, 0o600)
+        else:
+            self.server = await asyncio.start_server(self.handle,
+                                                     *self.address)
+            self.address = self.server.sockets[0].getsockname()[:2]
+
+        self.loop = asyncio.get_running_loop()
+        self.ready.set()
+
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        """Serve in a thread of its own, returning once listening"""
+        self.thread = threading.Thread(target=asyncio.run,
+                                       args=(self.serve(),))
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.thread.join()
+
+    async def authenticate(self, reader):
+        """Whether a connection starts with the token, if one is needed"""
+        if self.token is None:
+            return True
+
+        (channel, frame_type, length) = \
+            header.unpack(await reader.readexactly(header.size))
+        if frame_type != AUTH or length > self.max_token:
+            return False
+
+        return hmac.compare_digest(await reader.readexactly(length),
+                                   self.token)
+
+    async def handle(self, reader, writer):
+        processes = {}
+        tasks = set()
+        lock = asyncio.Lock()
+
+        async def send(channel, frame_type, payload=b''):
+            async with lock:
+                writer.write(frame(channel, frame_type, payload))
+                await writer.drain()
+
+        try:
+            if not await self.authenticate(reader):
+                logging.debug("Agent rejected a connection without token")
+                return
+
+            while True:
+                (channel, frame_type, length) = \
+                    header.unpack(await reader.readexactly(header.size))
+                payload = await reader.readexactly(length)
+
+                if frame_type == RUN:
+                    task = asyncio.create_task(
+                        self.run(channel, json.loads(payload), processes,
+                                 send))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif frame_type == KILL and channel in processes:
+                    kill(*processes[channel])
+        except (asyncio.IncompleteReadError, ConnectionError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            # Nobody is left to read the output of the cases
+            for process in processes.values():
+                kill(*process)
+            for task in list(tasks):
+                task.cancel()
+            writer.close()
+
+    async def run(self, channel, request, processes, send):
+        logging.debug("Agent running " + str(request['command']))
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *request['command'], stdout=subprocess.PIPE,
+                env=request['environment'],
+                start_new_session=request['session'])
+        except OSError as e:
+            await send(channel, EXIT, json.dumps({'error': str(e)}).encode())
+            return
+
+        processes[channel] = (process, request['session'])
+        try:
+            while True:
+                data = await process.stdout.read(65536)
+                if not data:
+                    break
+                await send(channel, OUTPUT, data)
+
+            returncode = await process.wait()
+            await send(channel, EXIT,
+                       json.dumps({'returncode': returncode}).encode())
+        except ConnectionError:
+            kill(process, request['session'])
+        finally:
+            del processes[channel]
+
+
+def kill(process, session):
+    """Kill a process started by the agent"""
+    try:
+        if session:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run mistest cases sent \
+        over a socket. The agent runs any command sent by whoever can \
+        connect to it. Listening on TCP therefore requires a shared token, \
+        which mistest sends with --agent-token-file. A Unix socket is only \
+        accessible to its owner, and can be reached from other hosts by \
+        forwarding it over SSH.')
+    parser.add_argument('--listen', '-l', default='127.0.0.1:4810',
+                        help='The host:port to listen on')
+    parser.add_argument('--unix', '-u', help='Listen on this Unix socket \
+                        instead')
+    parser.add_argument('--token-file', help='Require the token in this \
+                        file of every connection, required for TCP')
+    parser.add_argument('--debug', '-d', help='Enable debug logging',
+                        action='store_true')
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+
+    token = None
+    if args.token_file:
+        token = read_token(args.token_file)
+        if not token:
+            parser.error('the token file is empty')
+
+    if args.unix:
+        address = args.unix
+    else:
+        if token is None:
+            parser.error('listening on TCP requires --token-file, '
+                         'use --unix otherwise')
+        (host, _, port) = args.listen.rpartition(':')
+        address = (host, int(port))
+
+    asyncio.run(Agent(address, token).serve())
@@ -0,0 +1,163 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from .tap import pack, unpack
+
+
+class ResultCache:
+    """A content addressed cache of case execution results
+
+    Results are keyed by a hash of the case executable, its arguments,
+    its environment and the hashes of its dependencies. The results of
+    cases which passed are stored as JSON files in a directory, the
+    least recently used ones are evicted when the directory grows
+    beyond the maximum size.
+
+    Parameters
+    ----------
+    directory : The directory holding the cache.
+    max_size : The maximum size of the cache in bytes, or None.
+    rerun : Run all cases, only storing their results.
+    """
+
+    def __init__(self, directory, max_size=None, rerun=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.rerun = rerun
+        self.lock = threading.Lock()
+        self.file_hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def file_hash(self, file):
+        """Hash the contents of a file, once per run unless it changes"""
+        stat = os.stat(file)
+        key = (file, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            digest = self.file_hashes.get(key)
+
+        if digest is None:
+            with open(file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with self.lock:
+                self.file_hashes[key] = digest
+
+        return digest
+
+    def key(self, test):
+        """The content hash of a case or suite and its dependencies"""
+        h = hashlib.sha256()
+
+        if hasattr(test, 'test_list'):
+            h.update(json.dumps(['suite', self.file_hash(test.name)]).encode())
+            for suite_test in test.test_list:
+                h.update(self.key(suite_test).encode())
+        else:
+            environment = test.environment
+            if environment is not None:
+                environment = sorted(environment.items())
+            h.update(json.dumps(['case', os.path.realpath(test.file),
+                                 self.file_hash(test.file), test.arguments,
+                                 environment]).encode())
+
+        for dep in test.dependencies:
+            h.update(self.key(dep).encode())
+
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, case):
+        """Get the stored result of a case as a tuple of its Tap objects,
+        failure and duration, or None"""
+        if self.rerun:
+            self.count(False)
+            return None
+
+        path = self.path(self.key(case))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            # Mark the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            self.count(False)
+            return None
+
+        self.count(True)
+        return ([unpack(record) for record in entry['taps']],
+                entry['failed'], entry['duration'])
+
+    def store(self, case, result):
+        """Store the result of a case if it passed"""
+        if not result.passed():
+            return
+
+        path = self.path(self.key(case))
+        entry = {'taps': [pack(tap) for tap in result.tap_list],
+                 'failed': result.failed, 'duration': result.duration}
+
+        # Write atomically, other runs may be reading the cache
+        with tempfile.NamedTemporaryFile('w', dir=self.directory,
+                                         suffix='.tmp', delete=False) as f:
+            try:
+                json.dump(entry, f)
+            except:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    def evict(self):
+        """Remove the least recently used results beyond the maximum size"""
+        if self.max_size is None:
+            return
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for (mtime, entry_size, path) in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= entry_size
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return ("Result cache: %d hits, %d misses, %.0f%% hit rate" %
+                (self.hits, self.misses, rate))
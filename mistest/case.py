@@ -15,12 +15,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import array
+import atexit
+import bisect
+import json
+import logging
 import os
+import signal
 import subprocess
-from .tap import TestLine, Tap, Plan, Diagnostic, Parser
+import threading
+import time
+from .tap import TestLine, Tap, Plan, Diagnostic, LineReader
 from xml.etree.ElementTree import Element
 from .test import Test, TestResult, TestExecutionResult
-import unittest
+from . import timing
+from .outcomes import (run_outcomes, ok_outcome, todo_outcome,
+                       skip_outcome)
+from .remote import AgentConnection, AgentError, RemoteProcess, is_agent
 
 
 class CaseNotExecutable(Exception):
@@ -29,13 +40,38 @@ class CaseNotExecutable(Exception):
 
 
 class CaseExecutionResult(TestExecutionResult):
-    """The result of a test case execution run"""
+    """The result of a test case execution run
+
+    The Tap objects of the run are kept in a TapStore spilling to the
+    tap_segment when one is set, bounding the memory of long runs, and
+    in a plain list otherwise. Failing test lines are always kept in
+    memory."""
+
+    # The TapSegment shared by the results of all runs, if any
+    tap_segment = None
 
     def __init__(self, case, planned=None, ran=0, ok=0, not_ok=0, skip=0,
                  todo=0, failed=None):
         TestExecutionResult.__init__(self, case, planned, ran, ok, not_ok,
                                      skip, todo, failed)
-        self.tap_list = []
+        if self.tap_segment is None:
+            self.tap_list = []
+        else:
+            self.tap_list = self.tap_segment.store()
+        self.failures = []
+        self.duration = None
+
+        # The outcome of the test line of each number, zero if missing
+        self.line_outcomes = bytearray()
+
+        # The positions in tap_list of the test lines. Lines 1 up to
+        # numbered were numbered in sequence and are found from the
+        # number, adding the offset of the last offset number at or
+        # before it. Others are kept by number.
+        self.numbered = 0
+        self.offset_numbers = array.array('q')
+        self.offsets = array.array('q')
+        self.other_positions = {}
 
     def __len__(self):
         if self.planned is None:
@@ -50,13 +86,21 @@ class CaseExecutionResult(TestExecutionResult):
         except:
             raise IndexError()
 
-        for tap in self.tap_list:
-            if isinstance(tap, TestLine):
-                if key == tap.number:
-                    return tap
-
+        position = self.position(key)
         # If not all tests in the case were run.
-        return None
+        if position is None:
+            return None
+
+        return self.tap_list[position]
+
+    def position(self, number):
+        """Get the position in tap_list of the test line of a number"""
+        position = self.other_positions.get(number)
+        if position is None and 0 < number <= self.numbered:
+            i = bisect.bisect_right(self.offset_numbers, number) - 1
+            position = number + self.offsets[i]
+
+        return position
 
     def __iter__(self):
         for tap in self.tap_list:
@@ -67,13 +111,68 @@ class CaseExecutionResult(TestExecutionResult):
         return (TestExecutionResult.__eq__(self, other) and
                 self.tap_list == other.tap_list)
 
+    def passed(self):
+        """Whether the run completed its plan without failures, not ok
+        lines with a TODO directive do not count as failures"""
+        if self.failed is not None or self.planned != self.ran:
+            return False
+
+        return all(tap.directive == "TODO" for tap in self.failures)
+
     def append(self, tap):
+        # Handle plans
+        if isinstance(tap, Plan):
+            self.planned = tap.number
+
+        # Accumulate output in counters
+        if isinstance(tap, TestLine):
+            outcome = 0
+            self.ran += 1
+            if tap.ok:
+                self.ok += 1
+                outcome = ok_outcome
+            else:
+                self.not_ok += 1
+                self.failures.append(tap)
+
+            if tap.directive:
+                if tap.directive == "TODO":
+                    self.todo += 1
+                    outcome |= todo_outcome
+                if tap.directive == "SKIP":
+                    self.skip += 1
+                    outcome |= skip_outcome
+
+            self.index(tap.number, outcome)
+
         self.tap_list.append(tap)
 
+    def index(self, number, outcome):
+        """Index the test line of a number, about to be appended"""
+        # The first line of a number is the one returned
+        if (number < 1 or number <= self.numbered or
+                number in self.other_positions):
+            return
+
+        position = len(self.tap_list)
+        if number == self.numbered + 1:
+            # Lines numbered in sequence only need a new offset after
+            # other output, such as diagnostics
+            offset = position - number
+            if not self.offsets or self.offsets[-1] != offset:
+                self.offset_numbers.append(number)
+                self.offsets.append(offset)
+
+            self.numbered = number
+            while self.numbered + 1 in self.other_positions:
+                self.numbered += 1
+        else:
+            self.other_positions[number] = position
 
-class CaseInconsistentPlan(Exception):
-    """Test case has inconsisten plane"""
-    pass
+        missing = number - len(self.line_outcomes)
+        if missing > 0:
+            self.line_outcomes.extend(bytes(missing))
+        self.line_outcomes[number - 1] = outcome
 
 
 class CaseTestLineAggregate(Tap):
@@ -83,35 +182,16 @@ class CaseTestLineAggregate(Tap):
     a number which is the test number in the sequence,
     a description and a directive and directive description."""
 
-    def __init__(self, number, test_lines):
-        """Initialize by aggregating the test lines
+    def __init__(self, number, ok, directive=None):
+        """Initialize from the outcome of the number over all runs
 
         Some aggregation is deffered such as creating string representations.
         """
         self.number = number
-        self.test_lines = test_lines
+        self.ok = ok
         self.description = None
-        self.directive = None
-
-        self.ok = True
-        skip_count = 0
-        todo_count = 0
-        for line in test_lines:
-            # A single not ok makes everything not ok
-            if not line.ok:
-                self.ok = False
-
-            # Accumulate directives
-            if line.directive == "TODO":
-                todo_count += 1
-
-            if line.directive == "SKIP":
-                skip_count += 1
-
-        if todo_count == len(test_lines):
-            self.directive = "TODO"
-        elif skip_count == len(test_lines):
-            self.directive = "SKIP"
+        self.directive = directive
+        self.directive_description = None
 
     def __str__(self):
         test_line = ("ok" if self.ok else "not ok") + " " + str(self.number)
@@ -146,16 +226,32 @@ class CaseResult(TestResult):
         self.tap_aggregate_list = []
         self.execution_results = execution_results
 
+        # The number of execution results the plan was checked for and
+        # the aggregates built from, results are appended as runs end
+        self.planned_runs = None
+        self.planned = None
+        self.aggregated_runs = None
+        self.outcomes = None
+
     def __len__(self):
-        if len(self.execution_results) == 0:
+        runs = len(self.execution_results)
+        if runs == 0:
             return 0
 
-        planned = self.execution_results[0].planned
-        for result in self.execution_results:
-            if result.planned != planned:
-                raise CaseInconsistentPlan()
+        # Repeated runs may plan differently, such as a run bailing out
+        # before its plan, so the largest plan is used. Tests missing
+        # from a run are not ok in it.
+        if self.planned_runs != runs:
+            plans = [result.planned for result in self.execution_results
+                     if result.planned is not None]
+            self.planned = max(plans) if plans else None
+            self.planned_runs = runs
+
+        # Cases which failed before their plan have no test lines
+        if self.planned is None:
+            return 0
 
-        return planned
+        return self.planned
 
     def __getitem__(self, key):
         try:
@@ -164,19 +260,48 @@ class CaseResult(TestResult):
         except:
             raise IndexError()
 
-        if len(self.tap_aggregate_list) != len(self):
-            for i in range(1, len(self) + 1):
-                test_lines = [result[i] for result in self.execution_results]
-                test_lines_aggregate = CaseTestLineAggregate(i, test_lines)
-                self.tap_aggregate_list.append(test_lines_aggregate)
+        self.aggregate()
 
         return self.tap_aggregate_list[key - 1]
 
+    def __iter__(self):
+        """Iterate over the aggregates of all test numbers in order"""
+        self.aggregate()
+
+        return iter(self.tap_aggregate_list)
+
+    def aggregate(self):
+        """Aggregate the test lines of all runs in a single pass
+
+        Done again only once more runs have been appended."""
+        if self.aggregated_runs == len(self.execution_results):
+            return
+
+        self.outcomes = run_outcomes(len(self), self.execution_results)
+        self.tap_aggregate_list = [
+            CaseTestLineAggregate(number, ok, directive) for
+            (number, (ok, directive)) in enumerate(self.outcomes.aggregates(),
+                                                   1)]
+        self.aggregated_runs = len(self.execution_results)
+
+    def pass_rates(self):
+        """Get the fraction of runs in which each test was ok"""
+        self.aggregate()
+
+        return self.outcomes.pass_rates()
+
+    def flakiness(self):
+        """Get the fraction of consecutive runs in which the outcome of
+        each test changed"""
+        self.aggregate()
+
+        return self.outcomes.flakiness()
+
     def junit(self):
         element = Element('testsuite')
         element.attrib['name'] = self.test.junit_name()
-        for i in range(1, len(self) + 1):
-            element.append(self[i].junit())
+        for aggregate in self:
+            element.append(aggregate.junit())
 
         return element
 
@@ -184,14 +309,152 @@ class CaseResult(TestResult):
         self.execution_results.append(execution_result)
 
 
+class Watchdog(threading.Thread):
+    """A watchdog for a running test case
+
+    Kills the process group of the test case if it runs for longer than
+    the timeout, or if it produces no output for longer than the idle
+    timeout. The reason is then available as the reason attribute."""
+
+    def __init__(self, process, timeout=None, idle_timeout=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.process = process
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.started = time.monotonic()
+        self.last_output = self.started
+        self.stopped = threading.Event()
+        self.reason = None
+
+    def kick(self):
+        """Register output from the test case"""
+        self.last_output = time.monotonic()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def check(self):
+        """Return the reason to kill the test case, if any, and the
+        time until the next check"""
+        now = time.monotonic()
+        wait = None
+
+        if self.timeout:
+            remaining = self.started + self.timeout - now
+            if remaining <= 0:
+                return (timeout_reason(self.timeout), None)
+            wait = remaining
+
+        if self.idle_timeout:
+            remaining = self.last_output + self.idle_timeout - now
+            if remaining <= 0:
+                return (idle_timeout_reason(self.idle_timeout), None)
+            wait = remaining if wait is None else min(wait, remaining)
+
+        return (None, wait)
+
+    def run(self):
+        while True:
+            (reason, wait) = self.check()
+            if reason:
+                break
+            if self.stopped.wait(wait):
+                return
+
+        self.reason = reason
+        kill_group(self.process)
+
+
+def kill_group(process):
+    """Kill the process group of a watched test case"""
+    # The agent kills the group of cases running in a session
+    if isinstance(process, RemoteProcess):
+        process.kill()
+        return
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def kill_case(process, watched):
+    """Kill a test case abandoned by an exception, with its process
+    group if watched"""
+    if watched:
+        kill_group(process)
+        return
+
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+# The running watched cases. They run in sessions of their own, which
+# signals such as Ctrl-C to mistest do not reach, so their process
+# groups are killed when mistest exits.
+running_groups = set()
+running_groups_lock = threading.Lock()
+
+
+def track_group(process):
+    with running_groups_lock:
+        running_groups.add(process)
+
+
+def untrack_group(process):
+    with running_groups_lock:
+        running_groups.discard(process)
+
+
+def kill_running_groups():
+    """Kill the process groups of all running watched cases"""
+    with running_groups_lock:
+        processes = list(running_groups)
+        running_groups.clear()
+
+    for process in processes:
+        try:
+            kill_group(process)
+        except (OSError, AgentError):
+            pass
+
+
+atexit.register(kill_running_groups)
+
+
+def timeout_reason(timeout):
+    return "Timed out after " + str(timeout) + " seconds"
+
+
+def idle_timeout_reason(idle_timeout):
+    return "No output for " + str(idle_timeout) + " seconds"
+
+
 class Case(Test):
     """A test case
 
     Will fork and execute a provided test case, parsing the stdout during
-    execution."""
+    execution.
+
+    A case running for longer than its timeout, or without output for
+    longer than its idle timeout, is killed together with its process
+    group and recorded as failed. Cases without timeouts of their own
+    use the class wide defaults."""
+
+    default_timeout = None
+    default_idle_timeout = None
+
+    # A ResultCache replaying the results of unchanged cases, if any
+    result_cache = None
 
     def __init__(self, file, parent, sequence, arguments=[], dependencies=[],
-                 environment=None, name=None):
+                 environment=None, name=None, timeout=None,
+                 idle_timeout=None, repeat=1):
 
         Test.__init__(self)
 
@@ -217,6 +480,10 @@ class Case(Test):
         self.parent = parent
         self.execution_results = []
         self.sequence = sequence
+        self.repeat = repeat
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.cached_junit_name = None
 
         for test in dependencies:
             self.append_dep(test)
@@ -231,60 +498,263 @@ class Case(Test):
         self.result = CaseResult(self, self.execution_results)
         return self.result
 
-    def __call__(self, parser, resource):
+    def execution_failed(self, reason):
+        result = CaseExecutionResult(self)
+        result.failed = reason
+        self.execution_results.append(result)
+        return result
+
+    def started(self, resource):
+        """A tap Diagnostic to inform which test case has started"""
+        return Diagnostic("Running test case: \"" + self.name + "\" on "
+                          + resource)
+
+    def dependency_key(self):
+        """A hashable key, equal for equal cases"""
+        if self.cached_dependency_key is None:
+            environment = self.environment
+            if environment is not None:
+                environment = tuple(sorted(environment.items()))
+
+            self.cached_dependency_key = ('case', self.name, self.file,
+                                          environment, self.dependency_keys())
+
+        return self.cached_dependency_key
+
+    def history_key(self):
+        """The key of the case in a DurationHistory"""
+        return json.dumps([os.path.realpath(self.file)] + self.arguments)
+
+    def timeouts(self):
+        """Get the timeout and idle timeout of the case"""
+        timeout = self.timeout
+        if timeout is None:
+            timeout = Case.default_timeout
+
+        idle_timeout = self.idle_timeout
+        if idle_timeout is None:
+            idle_timeout = Case.default_idle_timeout
 
+        return (timeout, idle_timeout)
+
+    def spawn(self, resource, watched):
+        """Start the case on a resource, locally or on an agent
+
+        Returns a Popen, or a RemoteProcess behaving like one. Watched
+        cases get a session, and so a process group, of their own."""
         command = [self.file] + self.arguments
 
-        popen = subprocess.Popen(command, stdout=subprocess.PIPE,
-                                 env=self.environment)
+        if is_agent(resource):
+            connection = AgentConnection.get(resource)
+            return connection.spawn(command, self.environment, watched)
+
+        return subprocess.Popen(command, stdout=subprocess.PIPE,
+                                env=self.environment,
+                                start_new_session=watched)
+
+    def replay(self, cached, resource):
+        """Generate the output of a run from a cached result"""
+        (taps, failed, duration) = cached
+        result = CaseExecutionResult(self)
+
+        yield Diagnostic("Cached result of test case: \"" + self.name +
+                         "\" on " + resource)
+
+        for tap in taps:
+            result.append(tap)
+            yield tap
+
+        result.failed = failed
+        result.duration = duration
+        self.execution_results.append(result)
+
+        yield result
+
+    def __call__(self, parser, resource, replay=True):
+
+        # Repeated cases are run to see them fail, never replayed, and
+        # neither are dependencies run to set up for other tests
+        if replay and Case.result_cache and self.repetitions() == 1:
+            cached = Case.result_cache.lookup(self)
+            if cached:
+                yield from self.replay(cached, resource)
+                return
+
+        (timeout, idle_timeout) = self.timeouts()
+        watched = bool(timeout or idle_timeout)
+
+        start = time.monotonic()
+
+        try:
+            popen = self.spawn(resource, watched)
+            spawned = time.monotonic()
+        except (OSError, AgentError) as e:
+            yield self.started(resource)
+            yield self.execution_failed(str(e))
+            return
+
+        watchdog = None
+        if watched:
+            track_group(popen)
+            watchdog = Watchdog(popen, timeout, idle_timeout)
+            watchdog.start()
 
         # Set the parser input stream
         parser = parser(popen.stdout)
         result = CaseExecutionResult(self)
 
-        # Create a tap Diagnostic to inform which test case has started
-        yield Diagnostic("Running test case: \"" + self.name + "\" on "
-                         + resource)
+        yield self.started(resource)
 
         try:
             for tap_output in parser:
+                if watchdog:
+                    watchdog.kick()
+                result.append(tap_output)
+                yield tap_output
+
+        except Exception as e:
+            kill_case(popen, watched)
+            popen.wait()
+            result.failed = str(e)
+        finally:
+            popen.stdout.close()
+
+            if watchdog:
+                watchdog.stop()
+                if watchdog.reason:
+                    popen.wait()
+                    result.failed = watchdog.reason
 
-                # Handle plans
-                if isinstance(tap_output, Plan):
-                    result.planned = tap_output.number
+        if watched:
+            untrack_group(popen)
 
-                # Accumulate output in counters
-                if isinstance(tap_output, TestLine):
-                    result.ran += 1
-                    if tap_output.ok:
-                        result.ok += 1
+        result.duration = time.monotonic() - start
+        self.execution_results.append(result)
+
+        if timing.profile:
+            timing.profile.record_case(self, resource, result.duration,
+                                       spawned - start, parser.parse_time)
+
+        self.store_result(result)
+
+        yield result
+
+    async def run_async(self, parser, resource, replay=True):
+        """Run the test case on an asyncio event loop
+
+        Generates the same output as calling the case, reading the
+        stdout of the case without blocking the event loop."""
+
+        # Only the asyncio engine pays for importing asyncio
+        import asyncio
+
+        # Repeated cases are run to see them fail, never replayed, and
+        # neither are dependencies run to set up for other tests
+        if replay and Case.result_cache and self.repetitions() == 1:
+            cached = Case.result_cache.lookup(self)
+            if cached:
+                for output in self.replay(cached, resource):
+                    yield output
+                return
+
+        command = [self.file] + self.arguments
+        (timeout, idle_timeout) = self.timeouts()
+        watched = bool(timeout or idle_timeout)
+        start = time.monotonic()
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=subprocess.PIPE, env=self.environment,
+                start_new_session=watched)
+            spawned = time.monotonic()
+        except OSError as e:
+            yield self.started(resource)
+            yield self.execution_failed(str(e))
+            return
+
+        if watched:
+            track_group(process)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+
+        parser = parser(None)
+        reader = LineReader()
+        result = CaseExecutionResult(self)
+
+        yield self.started(resource)
+
+        try:
+            while True:
+                wait = idle_timeout
+                if deadline:
+                    remaining = deadline - loop.time()
+                    wait = remaining if not wait else min(wait, remaining)
+
+                try:
+                    data = await asyncio.wait_for(
+                        process.stdout.read(reader.block_size), wait)
+                except asyncio.TimeoutError:
+                    if deadline and loop.time() >= deadline:
+                        result.failed = timeout_reason(timeout)
                     else:
-                        result.not_ok += 1
+                        result.failed = idle_timeout_reason(idle_timeout)
 
-                    if tap_output.directive:
-                        if tap_output.directive == "TODO":
-                            result.todo += 1
-                        if tap_output.directive == "SKIP":
-                            result.skip += 1
+                    kill_group(process)
+                    await process.wait()
+                    break
 
-                result.append(tap_output)
+                lines = reader.feed(data) if data else reader.flush()
 
-                yield tap_output
+                for tap_output in parser.parse_batch(lines):
+                    result.append(tap_output)
+                    yield tap_output
+
+                if not data:
+                    parser.check_complete()
+                    break
 
         except Exception as e:
-            popen.kill()
+            kill_case(process, watched)
+            await process.wait()
             result.failed = str(e)
-        finally:
-            popen.stdout.close()
 
+        if watched:
+            untrack_group(process)
+
+        result.duration = time.monotonic() - start
         self.execution_results.append(result)
 
+        if timing.profile:
+            timing.profile.record_case(self, resource, result.duration,
+                                       spawned - start, parser.parse_time)
+
+        self.store_result(result)
+
         yield result
 
+    def store_result(self, result):
+        """Store the result of a run in the result cache, if any
+
+        The run has ended, so failing to store its result is only
+        logged, it is not a failure of the case."""
+        if not Case.result_cache:
+            return
+
+        try:
+            Case.result_cache.store(self, result)
+        except Exception as e:
+            logging.debug("Storing the result of " + self.name +
+                          " failed: " + str(e))
+
     def __str__(self):
         return self.file
 
     def junit_name(self):
+        # The name only depends on the parsed tree, compute it once
+        if self.cached_junit_name is not None:
+            return self.cached_junit_name
+
         junit_name = ""
 
         parent_junit_name = self.parent.junit_name()
@@ -300,6 +770,7 @@ class Case(Test):
         basename = basename[0:basename.find('.')]
         junit_name += count_str + '_' + basename
 
+        self.cached_junit_name = junit_name
         return junit_name
 
     def __iter__(self):
@@ -315,106 +786,3 @@ def looks_like_a_case(file):
         return True
     else:
         return False
-
-
-# Misleading name, this tests the Case class.
-class TestMistestCase(unittest.TestCase):
-
-    def setUp(self):
-        self.parser = Parser()
-
-    def run_case(self, tap_str, expected_result):
-        case = Case("/bin/echo", None, 1, arguments=['-en', tap_str])
-        expected_result.test = case
-        # Get results until we get the case execution result
-        for result in case(self.parser, "local"):
-            continue
-
-        self.assertEqual(expected_result, result)
-
-    def test_4_ok(self):
-        expected_result = CaseExecutionResult(None, planned=4, ran=4, ok=4)
-        expected_result.tap_list = [Plan(4, 'all of them'),
-                                    TestLine(True, 1),
-                                    TestLine(True, 2),
-                                    TestLine(True, 3),
-                                    TestLine(True, 4)]
-        self.run_case("1..4 # all of them\n"
-                      "ok\n"
-                      "ok\n"
-                      "ok\n"
-                      "ok",
-                      expected_result)
-
-    def test_3rd_nok(self):
-        expected_result = CaseExecutionResult(None, planned=3, ran=3, ok=2,
-                                              not_ok=1)
-        expected_result.tap_list = \
-            [Plan(3),
-             TestLine(True, 1, description="Hello"),
-             TestLine(True, 2, description="drat"),
-             TestLine(False, 3, description="Sometimes")]
-
-        self.run_case("1..3\n"
-                      "ok 1 Hello\n"
-                      "ok 2 drat\n"
-                      "not ok Sometimes\n", expected_result)
-
-    def test_skip(self):
-        expected_result = CaseExecutionResult(None, ran=1, ok=1, todo=1)
-        expected_result.tap_list = \
-            [TestLine(True, 1, directive="TODO",
-             directive_description="the directive")]
-        self.run_case("ok # ToDo the directive", expected_result)
-
-    def test_not_ok_skip(self):
-        expected_result = CaseExecutionResult(None, ran=1, ok=0,
-                                              not_ok=1, skip=1)
-        expected_result.tap_list = [TestLine(False, 1, directive="SKIP")]
-        self.run_case("not ok # skip", expected_result)
-
-    def not_tap(self):
-        expected_result = \
-            CaseExecutionResult(None,
-                                failed='Non-TAP input was encountered: '
-                                '"a wtf"')
-        self.run_case("a wtf", expected_result)
-
-    def test_bad_plan_too_many(self):
-        expected_result = \
-            CaseExecutionResult(None, planned=1, ran=1, ok=1,
-                                failed="Number of planned tests (1) exceeded")
-        expected_result.tap_list = [Plan(1), TestLine(True, 1)]
-        self.run_case("1..1\n"
-                      "ok 1\n"
-                      "ok 2\n", expected_result)
-
-    def test_bad_plan_too_few(self):
-        expected_result = \
-            CaseExecutionResult(None, planned=3, ran=2, ok=2,
-                                failed="Number of executed tests (2)"
-                                " less than the number of planned (3)")
-        expected_result.tap_list = [Plan(3),
-                                    TestLine(True, 1),
-                                    TestLine(True, 2)]
-        self.run_case("1..3\n"
-                      "ok 1\n"
-                      "ok 2\n", expected_result)
-
-    def test_bad_order(self):
-        expected_result = \
-            CaseExecutionResult(None, ran=1, ok=1,
-                                failed='Unexpected test number 3 expecting 2')
-        expected_result.tap_list = [TestLine(True, 1)]
-        self.run_case("ok\n"
-                      "ok 3\n", expected_result)
-
-    def test_bail_out(self):
-        expected_result = \
-            CaseExecutionResult(None, failed='Bail out!')
-        self.run_case("Bail out!", expected_result)
-
-# Self test by forking off a child which will print the test output.
-if __name__ == '__main__':
-
-    unittest.main()
@@ -0,0 +1,54 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class DependencyGraph:
+    """The dependency graph of a suite
+
+    A directed acyclic graph from every test of a suite, down through
+    the nested suites, to the dependencies it requires. Equal
+    dependencies declared by different suites are a single node, keyed
+    by their dependency key, which is computed once as the graph is
+    built.
+
+    Parameters
+    ----------
+    suite : The top level suite.
+    """
+
+    def __init__(self, suite):
+        self.nodes = {}
+        self.requirements_of = {}
+        self.add(suite)
+
+    def add(self, test):
+        """Add a test, and the tests of a suite, to the graph"""
+        keys = test.dependency_keys()
+        for (dep, key) in zip(test.dependencies, keys):
+            self.nodes.setdefault(key, dep)
+
+        self.requirements_of[id(test)] = frozenset(keys)
+
+        for suite_test in getattr(test, 'test_list', []):
+            self.add(suite_test)
+
+    def requirements(self, test):
+        """Get the keys of the dependencies required by a test"""
+        return self.requirements_of.get(id(test), frozenset())
+
+    def satisfied(self, test, completed):
+        """Count the dependencies of a test in a set of completed keys"""
+        return len(self.requirements(test) & completed)
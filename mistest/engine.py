@@ -0,0 +1,146 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+from .test import Test
+from .tap import Parser
+from .executor import (TerminateExecutor, UnknownExecutorMessage,
+                       ResultBatcher, pending_dependencies,
+                       dependencies_passed)
+import logging
+
+
+class EventLoop(threading.Thread):
+    """The thread running the event loop of all asynchronous executors
+
+    Child processes are reaped by the default child watcher of asyncio,
+    through pidfds from python 3.12. The child watcher is global, so it
+    is left alone."""
+
+    lock = threading.Lock()
+    shared = None
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    @classmethod
+    def get(cls):
+        """Get the shared event loop, starting it if needed"""
+        with cls.lock:
+            if cls.shared is None:
+                cls.shared = EventLoop()
+                cls.shared.start()
+                cls.shared.ready.wait()
+
+        return cls.shared.loop
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self.ready.set)
+        self.loop.run_forever()
+
+
+class AsyncExecutor:
+    """An asynchronous executor of test cases and suites
+
+    The asyncio counterpart of the Executor. All asynchronous executors
+    share a single event loop thread on which the output of all running
+    test cases is multiplexed, instead of using a thread per resource.
+    Tests are received from a queue and results placed in another queue
+    just as for the Executor."""
+
+    def __init__(self, resource, result_queue):
+        self.loop = EventLoop.get()
+
+        self.resource = resource
+        self.results = ResultBatcher(result_queue)
+        self.parser = Parser()
+        self.completed_dependencies = set()
+        self.failed_dependencies = set()
+
+        # The queue belongs to the event loop, so create it there
+        asyncio.run_coroutine_threadsafe(self.create_queue(),
+                                         self.loop).result()
+
+    async def create_queue(self):
+        self.test_queue = asyncio.Queue()
+
+    def start(self):
+        self.future = asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+
+    def join(self):
+        self.future.result()
+
+    def queue(self, test_or_message):
+        self.loop.call_soon_threadsafe(self.test_queue.put_nowait,
+                                       test_or_message)
+
+    def terminate(self):
+        self.queue(TerminateExecutor())
+
+    def __str__(self):
+        return self.resource
+
+    def queue_result(self, result):
+        result.resource = self.resource
+        result.executor = self
+        self.results.put(result)
+
+    def flush_results(self):
+        self.results.flush()
+
+    async def run(self):
+        while True:
+            message = await self.test_queue.get()
+
+            # Early exit of the loop on a terminate message
+            if isinstance(message, TerminateExecutor):
+                logging.debug("Executor " + self.resource + " terminating")
+                break
+
+            # Throw an exception in case of unknown messages.
+            if not isinstance(message, Test):
+                logging.debug("Executor " + self.resource + " unknown message")
+                raise UnknownExecutorMessage("Unknown message of type " +
+                                             str(type(message)))
+
+            logging.debug("Executor " + self.resource + " got a test")
+            test = message
+
+            # Execute dependencies and then the actual test, the test
+            # must end with a result even if running it raises
+            try:
+                for dep in pending_dependencies(test,
+                                                self.completed_dependencies):
+                    # Dependencies set up for the test, so always run
+                    async for result in dep.run_async(self.parser,
+                                                      self.resource, False):
+                        self.queue_result(result)
+                    if not result.passed():
+                        self.failed_dependencies.add(dep.dependency_key())
+
+                replay = dependencies_passed(test, self.failed_dependencies)
+                async for result in test.run_async(self.parser,
+                                                   self.resource, replay):
+                    self.queue_result(result)
+            except Exception as e:
+                logging.debug("Executor " + self.resource + " failed: " +
+                              str(e))
+                self.queue_result(test.execution_failed(str(e)))
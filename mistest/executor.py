@@ -15,8 +15,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import threading
+import time
 import queue
-from .test import Test
+from .test import Test, TestExecutionResult
 from .tap import Parser
 import logging
 
@@ -40,21 +41,101 @@ class UnknownExecutorMessage(Exception):
     pass
 
 
+class ResultBatcher:
+    """Batches the results of an executor on their way to the scheduler
+
+    Tap objects are put in the result queue in lists of up to batch_size,
+    sent once full, once the first of them is latency seconds old when
+    the next one is put, and when flushed. The scheduler flushes every
+    latency seconds, so a quiet case holds its lines back for at most
+    about twice the latency. Test execution results end the batch and
+    are sent immediately, so a free resource is noticed without delay.
+    Batches are put in the queue with the lock held, so that a flush
+    from the scheduler never reorders them.
+
+    Parameters
+    ----------
+    result_queue : The queue of the scheduler.
+    """
+
+    batch_size = 256
+    latency = 0.05
+
+    def __init__(self, result_queue):
+        self.result_queue = result_queue
+        self.lock = threading.Lock()
+        self.batch = []
+        self.deadline = None
+
+    def put(self, result):
+        with self.lock:
+            if isinstance(result, TestExecutionResult):
+                self.send()
+                self.result_queue.put(result)
+                return
+
+            self.batch.append(result)
+            if self.deadline is None:
+                self.deadline = time.monotonic() + self.latency
+            if (len(self.batch) >= self.batch_size or
+                    time.monotonic() >= self.deadline):
+                self.send()
+
+    def send(self):
+        """Send the batch, if any, with the lock held"""
+        if self.batch:
+            self.result_queue.put(self.batch)
+        self.batch = []
+        self.deadline = None
+
+    def flush(self):
+        """Send the results batched so far"""
+        with self.lock:
+            self.send()
+
+
+def pending_dependencies(test, completed_dependencies):
+    """Generate the dependencies of a test which have not yet been run,
+    marking them as completed
+
+    Completed dependencies are kept as a set of dependency keys, so
+    checking a dependency does not compare it to every completed one."""
+    for (dep, key) in zip(test.dependencies, test.dependency_keys()):
+        # Only run dependencies if they have not already been run.
+        if key in completed_dependencies:
+            continue
+        else:
+            completed_dependencies.add(key)
+
+        yield dep
+
+
+def dependencies_passed(test, failed_dependencies):
+    """Whether no dependency of a test failed on the executor
+
+    Tests whose dependencies failed in this run are never replayed from
+    the result cache, as their cached results would hide the failure."""
+    return not any(key in failed_dependencies
+                   for key in test.dependency_keys())
+
+
 class Executor(threading.Thread):
     """An executor of test cases and suites
 
     Runs the execution in a thread, receiving cases from a queue
-    and placing the result in another queue."""
+    and placing the result in another queue. A parser other than the
+    default TAP Parser may be given, e.g. one parsing in a ParserPool."""
 
-    def __init__(self, resource, result_queue):
+    def __init__(self, resource, result_queue, parser=None):
         threading.Thread.__init__(self)
         self.daemon = True
 
         self.resource = resource
         self.test_queue = queue.Queue()
-        self.result_queue = result_queue
-        self.parser = Parser()
-        self.completed_dependencies = []
+        self.results = ResultBatcher(result_queue)
+        self.parser = parser if parser else Parser()
+        self.completed_dependencies = set()
+        self.failed_dependencies = set()
 
     def queue(self, test_or_message):
         self.test_queue.put(test_or_message)
@@ -68,7 +149,10 @@ class Executor(threading.Thread):
     def queue_result(self, result):
         result.resource = self.resource
         result.executor = self
-        self.result_queue.put(result)
+        self.results.put(result)
+
+    def flush_results(self):
+        self.results.flush()
 
     def run(self):
         while True:
@@ -88,17 +172,21 @@ class Executor(threading.Thread):
             logging.debug("Executor " + self.resource + " got a test")
             test = message
 
-            # Execute dependencies and then the actual test
-            for dep in test.dependencies:
-
-                # Only run dependencies if they have not already been run.
-                if dep in self.completed_dependencies:
-                    continue
-                else:
-                    self.completed_dependencies.append(dep)
-
-                for result in dep(self.parser, self.resource):
+            # Execute dependencies and then the actual test, the test
+            # must end with a result even if running it raises
+            try:
+                for dep in pending_dependencies(test,
+                                                self.completed_dependencies):
+                    # Dependencies set up for the test, so always run
+                    for result in dep(self.parser, self.resource, False):
+                        self.queue_result(result)
+                    if not result.passed():
+                        self.failed_dependencies.add(dep.dependency_key())
+
+                replay = dependencies_passed(test, self.failed_dependencies)
+                for result in test(self.parser, self.resource, replay):
                     self.queue_result(result)
-
-            for result in test(self.parser, self.resource):
-                self.queue_result(result)
+            except Exception as e:
+                logging.debug("Executor " + self.resource + " failed: " +
+                              str(e))
+                self.queue_result(test.execution_failed(str(e)))
@@ -0,0 +1,83 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import statistics
+
+
+class DurationHistory:
+    """A local store of test case durations
+
+    Keeps an exponentially weighted mean of the wall durations of each
+    case, keyed by the case path and arguments, in a JSON file.
+
+    Parameters
+    ----------
+    file : The JSON file holding the history.
+    """
+
+    # The weight of the latest run in the mean
+    weight = 0.3
+
+    # The estimate for cases when nothing at all is known
+    default_estimate = 1.0
+
+    def __init__(self, file):
+        self.file = file
+        self.durations = {}
+        self.median = None
+
+        if os.path.exists(file):
+            with open(file) as f:
+                self.durations = json.load(f)
+
+    def record(self, case, duration):
+        key = case.history_key()
+        entry = self.durations.get(key)
+
+        if entry is None:
+            self.durations[key] = {'duration': duration, 'runs': 1}
+        else:
+            entry['duration'] += (duration - entry['duration']) * self.weight
+            entry['runs'] += 1
+
+        self.median = None
+
+    def estimate(self, case):
+        """Estimate the duration of a case
+
+        Cases without a history are estimated at the median of all
+        known cases."""
+        entry = self.durations.get(case.history_key())
+        if entry is not None:
+            return entry['duration']
+
+        if not self.durations:
+            return self.default_estimate
+
+        if self.median is None:
+            self.median = statistics.median(entry['duration'] for entry
+                                            in self.durations.values())
+
+        return self.median
+
+    def save(self):
+        # Write the history atomically, it is read on every run
+        temporary = self.file + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.file)
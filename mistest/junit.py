@@ -0,0 +1,148 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+from . import timing
+from xml.etree.ElementTree import Element, tostring
+
+
+def escape_attribute(text):
+    """Escape an attribute value as ElementTree does, as us-ascii"""
+    text = (text.replace("&", "&amp;").replace("<", "&lt;")
+            .replace(">", "&gt;").replace("\"", "&quot;")
+            .replace("\r", "&#13;").replace("\n", "&#10;")
+            .replace("\t", "&#09;"))
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+
+
+def junit_events(suite):
+    """Generate the elements of the JUnit tree of a suite in document
+    order, cases standing in for their whole testsuite element"""
+
+    # The top level suite is anonymous, as in SuiteResult.junit
+    attrib = {}
+    if suite.parent:
+        attrib['name'] = suite.junit_name()
+
+    yield ('start', 'testsuite', attrib)
+
+    for test in suite.test_list:
+        if hasattr(test, 'test_list'):
+            yield from junit_events(test)
+        else:
+            yield ('case', test)
+
+    yield ('end', 'testsuite')
+
+
+class JUnitWriter:
+    """A streaming JUnit XML writer
+
+    Writes the same bytes as the ElementTree built by SuiteResult.junit,
+    but case by case as the result of each case becomes final, so that
+    the TAP lines of a case are only held while the case is written.
+    The testcase elements of the lines are written as strings. Cases are written in suite order, a case finishing early
+    waits for the cases before it. The file is flushed periodically, a
+    run which dies leaves the report up to the last flush.
+
+    Parameters
+    ----------
+    file : The file to write the JUnit XML to.
+    suite : The top level suite.
+    """
+
+    # Seconds between flushes of the file
+    flush_interval = 1.0
+
+    def __init__(self, file, suite):
+        self.file = open(file, 'wb')
+        self.events = list(junit_events(suite))
+        self.position = 0
+        self.finished_cases = set()
+        self.pending = None
+        self.last_flush = time.monotonic()
+
+        self.start('testsuites', {})
+
+    def start(self, tag, attrib):
+        """Start an element, the start tag is only complete once it is
+        known whether the element is empty"""
+        self.complete_pending()
+        # Let ElementTree escape the attributes, dropping the " />"
+        self.pending = tostring(Element(tag, attrib),
+                                encoding='us-ascii')[:-3]
+
+    def end(self, tag):
+        if self.pending is not None:
+            self.file.write(self.pending + b' />')
+            self.pending = None
+        else:
+            self.file.write(b'</' + tag.encode() + b'>')
+
+    def complete_pending(self):
+        if self.pending is not None:
+            self.file.write(self.pending + b'>')
+            self.pending = None
+
+    def write_case(self, case):
+        start = time.perf_counter()
+        result = case.generate_result()
+
+        self.start('testsuite', {'name': case.junit_name()})
+        testcases = [b'<testcase name="' + escape_attribute(str(aggregate)) +
+                     (b'" />' if aggregate.ok else
+                      b'"><failure /></testcase>')
+                     for aggregate in result]
+        if testcases:
+            self.complete_pending()
+            self.file.write(b''.join(testcases))
+        self.end('testsuite')
+
+        if timing.profile:
+            timing.profile.add('junit', time.perf_counter() - start)
+
+    def finished(self, case):
+        """Register that the result of a case is final"""
+        self.finished_cases.add(id(case))
+        self.advance()
+
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def advance(self, final=False):
+        """Write all elements up to the first unfinished case, or all
+        remaining elements if final"""
+        while self.position < len(self.events):
+            event = self.events[self.position]
+
+            if event[0] == 'start':
+                self.start(event[1], event[2])
+            elif event[0] == 'end':
+                self.end(event[1])
+            elif final or id(event[1]) in self.finished_cases:
+                self.write_case(event[1])
+            else:
+                break
+
+            self.position += 1
+
+    def close(self):
+        self.advance(final=True)
+        self.end('testsuites')
+        self.file.close()
@@ -0,0 +1,213 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+class RunMetrics:
+    """Live metrics of a run
+
+    Counted by the scheduler thread as results arrive, with a handful of
+    additions per batch of TAP lines and per result. Snapshots of the
+    state of the run are only built when published, and never change
+    it, so any number of consumers may take them. The rate of lines is
+    taken from a ring of samples of the line count.
+
+    Parameters
+    ----------
+    scheduler : The scheduler of the run.
+    """
+
+    # Seconds between samples of the line count, and the seconds of
+    # samples the rate of lines is measured over
+    sample_interval = 1.0
+    rate_window = 10.0
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.start = time.monotonic()
+
+        # Tests handed out by the scheduler, counting each repetition
+        self.total = sum(test.repetitions() for test in scheduler.suite)
+        self.completed = 0
+
+        self.lines = 0
+        self.passed = 0
+        self.failed = 0
+        self.scheduled_at = {}
+
+        # The times and line counts sampled, for the rate
+        self.samples = collections.deque(
+            [(self.start, 0)],
+            maxlen=int(self.rate_window / self.sample_interval) + 1)
+
+    def scheduled(self, resource):
+        self.scheduled_at[resource] = time.monotonic()
+
+    def record_lines(self, count):
+        self.lines += count
+
+        now = time.monotonic()
+        if now - self.samples[-1][0] >= self.sample_interval:
+            self.samples.append((now, self.lines))
+
+    def record_case(self, result):
+        if result.passed():
+            self.passed += 1
+        else:
+            self.failed += 1
+
+    def record_completed(self):
+        self.completed += 1
+
+    def snapshot(self):
+        """Get the current state of the run as a JSON serializable dict"""
+        scheduler = self.scheduler
+        now = time.monotonic()
+        elapsed = now - self.start
+
+        resources = {}
+        for resource in scheduler.resources:
+            test = scheduler.scheduled_tests[resource]
+            state = {'state': 'idle' if test is None else 'busy',
+                     'queued': scheduler.executors[resource].test_queue.qsize()}
+            # The scheduler runs concurrently, a test may just have been
+            # scheduled without its start being recorded yet
+            scheduled_at = self.scheduled_at.get(resource)
+            if test is not None:
+                state['test'] = str(test)
+                if scheduled_at is not None:
+                    state['running'] = now - scheduled_at
+            resources[resource] = state
+
+        remaining = max(self.total - self.completed -
+                        scheduler.repetitions.dropped, 0)
+
+        # Remaining tests are expected to take as long as completed ones
+        estimate = None
+        if self.completed:
+            estimate = elapsed / self.completed * remaining
+
+        # The rate since the oldest sample within the window, or since
+        # the last sample when no lines arrived within it
+        lines = self.lines
+        samples = list(self.samples)
+        (sampled, sampled_lines) = samples[-1]
+        for (time_sampled, lines_sampled) in samples:
+            if now - time_sampled <= self.rate_window:
+                (sampled, sampled_lines) = (time_sampled, lines_sampled)
+                break
+
+        rate = 0.0
+        if now > sampled:
+            rate = (lines - sampled_lines) / (now - sampled)
+
+        return {'elapsed': elapsed,
+                'resources': resources,
+                'result_queue': scheduler.result_queue.qsize(),
+                'tests': {'completed': self.completed,
+                          'remaining': remaining},
+                'cases': {'passed': self.passed, 'failed': self.failed},
+                'lines': lines,
+                'lines_per_second': rate,
+                'estimated_remaining': estimate}
+
+
+class MetricsPublisher(threading.Thread):
+    """Publishes the metrics of a run
+
+    Rewrites a JSON file every interval seconds and, if given a port,
+    serves the metrics as JSON over HTTP on the loopback interface.
+
+    Parameters
+    ----------
+    metrics : The RunMetrics to publish.
+    file : The JSON file to rewrite, or None.
+    port : The local port to serve on, 0 for any free port, or None.
+    interval : Seconds between rewrites of the file.
+    """
+
+    def __init__(self, metrics, file=None, port=None, interval=5.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.metrics = metrics
+        self.file = file
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.server = None
+
+        if port is not None:
+            self.server = metrics_server(self, port)
+            self.port = self.server.server_address[1]
+            threading.Thread(target=self.server.serve_forever,
+                             daemon=True).start()
+
+    def snapshot(self):
+        # Snapshots are taken by this thread and the server threads
+        with self.lock:
+            return self.metrics.snapshot()
+
+    def write(self):
+        # Write the file atomically, it may be read at any time
+        temporary = self.file + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.replace(temporary, self.file)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.file:
+                self.write()
+
+    def stop(self):
+        """Stop publishing, writing the final metrics"""
+        self.stopped.set()
+        self.join()
+
+        if self.file:
+            self.write()
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def metrics_server(publisher, port):
+    """Create an HTTP server of the metrics of a publisher"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = json.dumps(publisher.snapshot(), sort_keys=True).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics request: " + format % args)
+
+    return ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
@@ -0,0 +1,158 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# The bits of the outcome of a test line in a run, kept per test number
+# by each case execution result. A line missing from a run is zero, not
+# ok and without a directive.
+ok_outcome = 1
+todo_outcome = 2
+skip_outcome = 4
+
+# NumPy is optional, imported on first use of repeated runs. None until
+# then and False when it is not installed.
+numpy = None
+
+# The number of runs from which outcomes are kept in NumPy arrays
+vectorize_runs = 2
+
+
+def load_numpy():
+    global numpy
+
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            module = False
+        numpy = module
+
+    return numpy
+
+
+def run_outcomes(planned, execution_results):
+    """Collect the outcomes of the execution results of a case
+
+    Uses NumPy arrays for repeated runs when NumPy is installed, and
+    per test counters otherwise."""
+    if len(execution_results) >= vectorize_runs and load_numpy():
+        return ArrayOutcomes(planned, execution_results)
+
+    return CountedOutcomes(planned, execution_results)
+
+
+def planned_outcomes(result, planned):
+    """Get the outcomes of the planned tests of an execution result"""
+    return bytes(result.line_outcomes[:planned]).ljust(planned, b'\0')
+
+
+class CountedOutcomes:
+    """The outcomes of the runs of a case, counted per test
+
+    The flakiness of a test is the fraction of consecutive runs in which
+    it changed between ok and not ok.
+
+    Parameters
+    ----------
+    planned : The number of tests of the case.
+    execution_results : The CaseExecutionResults of the runs.
+    """
+
+    def __init__(self, planned, execution_results):
+        self.planned = planned
+        self.runs = len(execution_results)
+        self.ok = [0] * planned
+        self.todo = [0] * planned
+        self.skip = [0] * planned
+        self.flips = [0] * planned
+
+        previous = None
+        for result in execution_results:
+            outcomes = planned_outcomes(result, planned)
+            self.ok = [count + (outcome & ok_outcome) for (count, outcome)
+                       in zip(self.ok, outcomes)]
+            self.todo = [count + (outcome & todo_outcome != 0) for
+                         (count, outcome) in zip(self.todo, outcomes)]
+            self.skip = [count + (outcome & skip_outcome != 0) for
+                         (count, outcome) in zip(self.skip, outcomes)]
+
+            if previous is not None:
+                self.flips = [flips + ((a ^ b) & ok_outcome) for (flips, a, b)
+                              in zip(self.flips, outcomes, previous)]
+            previous = outcomes
+
+    def aggregates(self):
+        """Get the ok and directive of each test over all runs"""
+        runs = self.runs
+        return [(ok == runs,
+                 "TODO" if todo == runs else "SKIP" if skip == runs else None)
+                for (ok, todo, skip) in zip(self.ok, self.todo, self.skip)]
+
+    def pass_rates(self):
+        """Get the fraction of runs in which each test was ok"""
+        return [ok / self.runs for ok in self.ok]
+
+    def flakiness(self):
+        """Get the fraction of consecutive runs each test changed in"""
+        if self.runs < 2:
+            return [0.0] * self.planned
+
+        return [flips / (self.runs - 1) for flips in self.flips]
+
+
+class ArrayOutcomes:
+    """The outcomes of the runs of a case in a NumPy array
+
+    Holds the outcomes in a runs by tests array, giving the same results
+    as the CountedOutcomes with vectorized operations.
+
+    Parameters
+    ----------
+    planned : The number of tests of the case.
+    execution_results : The CaseExecutionResults of the runs.
+    """
+
+    def __init__(self, planned, execution_results):
+        self.planned = planned
+        self.runs = len(execution_results)
+
+        outcomes = b''.join(planned_outcomes(result, planned)
+                            for result in execution_results)
+        outcomes = numpy.frombuffer(outcomes, dtype=numpy.uint8)
+        outcomes = outcomes.reshape((self.runs, planned))
+        self.ok = (outcomes & ok_outcome) != 0
+        self.todo = (outcomes & todo_outcome) != 0
+        self.skip = (outcomes & skip_outcome) != 0
+
+    def aggregates(self):
+        """Get the ok and directive of each test over all runs"""
+        ok = self.ok.all(axis=0).tolist()
+        directives = numpy.where(self.todo.all(axis=0), "TODO",
+                                 numpy.where(self.skip.all(axis=0), "SKIP",
+                                             None)).tolist()
+        return list(zip(ok, directives))
+
+    def pass_rates(self):
+        """Get the fraction of runs in which each test was ok"""
+        return self.ok.mean(axis=0).tolist()
+
+    def flakiness(self):
+        """Get the fraction of consecutive runs each test changed in"""
+        if self.runs < 2:
+            return [0.0] * self.planned
+
+        flips = (self.ok[1:] != self.ok[:-1]).sum(axis=0)
+        return (flips / (self.runs - 1)).tolist()
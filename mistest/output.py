@@ -14,19 +14,126 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
+import queue
+import sys
+import threading
+import time
 from .tap import Tap
 from .case import CaseExecutionResult
+from .junit import JUnitWriter
+from . import timing
 from xml.etree.ElementTree import Element,ElementTree
 
+
+class OutputWriter(threading.Thread):
+    """A thread writing the output of a run
+
+    Text written by the scheduler thread is coalesced into batches of up
+    to buffer_size characters, which are queued to and written by this
+    thread. A slow terminal or pipe thus only stalls the scheduler once
+    the queue is full. Text not yet making up a batch is written when
+    flushed, or by the thread after at most flush_interval seconds.
+
+    Parameters
+    ----------
+    stream : The stream to write to.
+    """
+
+    # The number of queued batches beyond which writing blocks
+    queue_size = 64
+
+    # Characters and seconds pending text is held for at most
+    buffer_size = 65536
+    flush_interval = 0.1
+
+    def __init__(self, stream):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.stream = stream
+        # Batches of text, None ends the thread
+        self.queue = queue.Queue(self.queue_size)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.size = 0
+        self.error = None
+
+    def write(self, text):
+        with self.lock:
+            self.pending.append(text)
+            self.size += len(text)
+            if self.size < self.buffer_size:
+                return
+            batch = self.take_pending()
+
+        self.queue.put(batch)
+
+    def take_pending(self):
+        """Take the pending text as a batch, with the lock held"""
+        batch = ''.join(self.pending)
+        self.pending = []
+        self.size = 0
+        return batch
+
+    def flush(self):
+        with self.lock:
+            batch = self.take_pending()
+
+        if batch:
+            self.queue.put(batch)
+
+    def close(self):
+        """Write all pending text and end the thread"""
+        self.flush()
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            try:
+                batch = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                with self.lock:
+                    batch = self.take_pending()
+
+            if batch is None:
+                break
+
+            if batch:
+                self.write_batch(batch)
+
+    def write_batch(self, batch):
+        # Once the stream fails, such as a closed pipe, output is
+        # dropped rather than blocking the scheduler on a full queue
+        if self.error:
+            return
+
+        try:
+            start = time.perf_counter()
+            self.stream.write(batch)
+            self.stream.flush()
+            if timing.profile:
+                timing.profile.add('output writing',
+                                   time.perf_counter() - start)
+        except OSError as e:
+            logging.debug("Output failed: " + str(e))
+            self.error = e
+
+
 class Output:
     """The output class
 
-    Handles output, both during execution and during post-processing"""
+    Handles output, both during execution and during post-processing.
+    Output is written by an OutputWriter once the output is started."""
 
     def __init__(self):
         self.immediate = True
         self.prefix_with_resource = False
         self.junit_xml = None
+        self.junit_writer = None
+        self.writer = None
+        self.summary = []
 
     def set_immediate(self, immediate):
         self.immediate = immediate
@@ -36,40 +143,94 @@ class Output:
     def set_junit_xml(self, junit_xml):
         self.junit_xml = junit_xml
 
-    def format_result(self, result):
-        output_str = ""
+    def start(self, suite):
+        """Start the output of a run of a suite
 
-        if self.prefix_with_resource:
-            output_str += str(result.resource) + " : "
+        JUnit XML is written while the run goes on."""
+        if self.junit_xml:
+            self.junit_writer = JUnitWriter(self.junit_xml, suite)
+
+        self.writer = OutputWriter(sys.stdout)
+        self.writer.start()
 
-        output_str += str(result)
+    def write(self, text):
+        if self.writer:
+            self.writer.write(text)
+        else:
+            sys.stdout.write(text)
 
-        return output_str
+    def prefix(self, result):
+        if self.prefix_with_resource:
+            return str(result.resource) + " : "
+        else:
+            return ""
+
+    def format_result(self, result):
+        return self.prefix(result) + str(result) + "\n"
 
     def __call__(self, result):
 
         if self.immediate and isinstance(result, Tap):
-            print(self.format_result(result))
+            self.write(self.format_result(result))
         elif not self.immediate and isinstance(result, CaseExecutionResult):
-            for tap in result:
-                print(self.format_result(tap))
+            prefix = self.prefix(result)
+            self.write("".join([prefix + str(tap) + "\n" for tap in result]))
 
         if isinstance(result, CaseExecutionResult):
-            print(self.format_result(result))
+            self.write(self.format_result(result))
+
+            # Show each completed case without delay
+            if self.writer:
+                self.writer.flush()
+
+    def finished(self, test):
+        """Register that all runs of a test handed out by the scheduler
+        are done, its results and those of the tests it contains are
+        final"""
+        if hasattr(test, 'test_list'):
+            for suite_test in test.test_list:
+                self.finished(suite_test)
+        elif self.junit_writer:
+            self.junit_writer.finished(test)
 
     def output_junit_xml(self, suite):
+        start = time.perf_counter()
         element = Element('testsuites')
         element.append(suite.junit())
         tree = ElementTree(element)
         tree.write(self.junit_xml)
 
+        if timing.profile:
+            timing.profile.add('junit', time.perf_counter() - start)
+
+    def summarize(self, line):
+        """Add a line to the execution summary"""
+        self.summary.append(line)
+
     def output_execution_summary(self, suite):
-        print("# Execution summary: ")
+        self.write("# Execution summary: \n")
+        self.write("".join(["# " + line + "\n" for line in self.summary]))
 #        print("# Ran: " + str(suite.total) + " Passed: " + str(suite.passed) + \
 #            " Skipped: " + str(suite.skipped) + " Failed: " + str(suite.failed))
 
     def postprocess(self, result):
         self.output_execution_summary(result)
-        if self.junit_xml:
+        if self.junit_xml and not self.junit_writer:
             self.output_junit_xml(result)
 
+        self.close()
+
+    def close(self):
+        """Write out everything output so far and close the JUnit XML
+
+        Also called when a run ends abnormally, such as by Ctrl-C, the
+        writer thread is a daemon which would otherwise drop pending
+        text, and the JUnit XML is completed with the runs so far."""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+        if self.junit_writer:
+            self.junit_writer.close()
+            self.junit_writer = None
+
@@ -0,0 +1,113 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import pickle
+import logging
+
+# Plans written by another version of mistest are never loaded
+plan_version = 3
+
+
+def plan_files(suite):
+    """Get the suite files and case executables of a parsed tree"""
+    files = set()
+
+    def walk(test):
+        if hasattr(test, 'test_list'):
+            # The top level suite is not read from a file
+            if test.parent is not None:
+                files.add(test.name)
+            for suite_test in test.test_list:
+                walk(suite_test)
+        else:
+            files.add(test.file)
+
+        for dep in test.dependencies:
+            walk(dep)
+
+    walk(suite)
+    return files
+
+
+def file_signature(file):
+    stat = os.stat(file)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_mode)
+
+
+class PlanCache:
+    """A compiled plan of a parsed suite tree
+
+    Stores the fully resolved tree of suites and cases, including
+    dependencies, orderings, sequences and JUnit names, for the command
+    line it was parsed from. The plan is invalid once the modification
+    time, size or mode of any suite file or case executable changes, so
+    an unchanged tree is loaded without reading any YAML.
+
+    Parameters
+    ----------
+    file : The file holding the plan.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def load(self, arguments):
+        """Load the resources and top level suite parsed from a command
+        line, or None if there is no valid plan"""
+        arguments = [os.getcwd()] + arguments
+        try:
+            with open(self.file, 'rb') as f:
+                (version, plan_arguments, signatures, plan) = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+        if version != plan_version or plan_arguments != arguments:
+            return None
+
+        try:
+            for (file, signature) in signatures.items():
+                if file_signature(file) != signature:
+                    logging.debug("Plan invalidated by " + file)
+                    return None
+        except OSError:
+            return None
+
+        return plan
+
+    def save(self, arguments, resources, suite):
+        """Save the resources and top level suite parsed from a command
+        line"""
+        arguments = [os.getcwd()] + arguments
+        signatures = {}
+        for file in plan_files(suite):
+            signatures[file] = file_signature(file)
+
+        # Compute the JUnit names now, so that they are part of the plan
+        def compute_junit_names(test):
+            test.junit_name()
+            for suite_test in getattr(test, 'test_list', []):
+                compute_junit_names(suite_test)
+
+        compute_junit_names(suite)
+
+        temporary = self.file + '.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump((plan_version, arguments, signatures,
+                         (resources, suite)), f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.file)
@@ -0,0 +1,119 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .tap import Parser, LineReader, pack, unpack
+
+# The parser of a worker process, created on first use
+worker_parser = None
+
+
+def parse_block(state, data, final):
+    """Parse a block of raw case output in a worker process
+
+    The state is the tuple (planned number, test number, partial line)
+    left by the previous block of the same stream. Returns the new state,
+    the packed records and the error which ended parsing, if any."""
+    global worker_parser
+
+    if worker_parser is None:
+        worker_parser = Parser()
+
+    parser = worker_parser(None)
+    (parser.planned_number, parser.test_number, partial) = state
+
+    # Lines are split on the raw bytes, which never splits a UTF-8
+    # sequence, so each complete line decodes on its own.
+    data = partial + data
+    end = len(data) if final else data.rfind(b'\n') + 1
+    text = data[:end].decode('utf-8', 'replace')
+    lines = text.split('\n')
+    if not final or lines[-1] == '':
+        lines.pop()
+
+    records = []
+    error = None
+    try:
+        for tap in parser.parse_batch(lines):
+            records.append(pack(tap))
+
+        if final:
+            parser.check_complete()
+    except Exception as e:
+        error = e
+
+    state = (parser.planned_number, parser.test_number, data[end:])
+    return (state, records, error)
+
+
+class ParserPool:
+    """A pool of worker processes parsing TAP
+
+    Moves parsing out of the main process, where it would otherwise
+    be serialized with the scheduler and all other executors."""
+
+    def __init__(self, workers):
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    def parser(self):
+        """Create a parser which parses in the pool"""
+        return PooledParser(self)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+class PooledParser:
+    """A TAP parser handing the parsing over to a ParserPool
+
+    Behaves like the Parser, generating the same Tap objects and raising
+    the same errors at the same points, while only reading the raw output
+    of the case in the calling thread."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __call__(self, input_stream):
+        self.input_stream = input_stream
+        # Seconds spent waiting for the pool, for profiling
+        self.parse_time = 0.0
+        return self
+
+    def __iter__(self):
+        buffer = bytearray(LineReader.block_size)
+        read = getattr(self.input_stream, 'readinto1',
+                       self.input_stream.readinto)
+        state = (None, 0, b'')
+        final = False
+
+        while not final:
+            count = read(buffer)
+            final = not count
+            start = time.perf_counter()
+            future = self.pool.executor.submit(parse_block, state,
+                                               bytes(buffer[:count]), final)
+            (state, records, error) = future.result()
+            self.parse_time += time.perf_counter() - start
+
+            for record in records:
+                yield unpack(record)
+
+            if error:
+                raise error
@@ -0,0 +1,284 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import itertools
+import json
+import socket
+import struct
+import threading
+import urllib.parse
+
+# Each frame starts with the channel, the frame type and the payload length
+header = struct.Struct('!IBI')
+
+# Start a case, a JSON object with command, environment and session
+RUN = 1
+# Output of a case, raw bytes from its stdout
+OUTPUT = 2
+# A case has exited, a JSON object with returncode or error
+EXIT = 3
+# Kill a case, and its process group if it has a session of its own
+KILL = 4
+# The first frame of a connection to an agent requiring a token, the token
+AUTH = 5
+
+# The shared token sent to agents, bytes, or None to send none
+token = None
+
+# The prefix of resources which are agents
+scheme = 'agent://'
+
+
+class AgentError(Exception):
+    """Failed to run a case on an agent"""
+    pass
+
+
+def is_agent(resource):
+    return resource.startswith(scheme)
+
+
+def parse_address(resource):
+    """Get the socket address of an agent resource
+
+    Resources are agent://host:port for TCP or agent:///path for a Unix
+    socket. A fragment, as in agent://host:port#2, names one of several
+    resources sharing the connection to an agent."""
+    url = urllib.parse.urlsplit(resource)
+    if not url.netloc:
+        return url.path
+
+    if url.hostname is None or url.port is None:
+        raise AgentError("Expected agent://host:port, got " + resource)
+
+    return (url.hostname, url.port)
+
+
+def read_token(file):
+    """Read a shared token from a file"""
+    with open(file, 'rb') as f:
+        return f.read().strip()
+
+
+def frame(channel, frame_type, payload=b''):
+    return header.pack(channel, frame_type, len(payload)) + payload
+
+
+class RemoteStream:
+    """The stdout of a case running on an agent
+
+    A binary stream read through readinto, fed with the output frames
+    received from the agent. At most max_buffered bytes are held, beyond
+    which feeding blocks until the case is read. The connection then
+    holds back the agent, and all cases sharing the connection, instead
+    of the output of a fast case piling up in memory."""
+
+    max_buffered = 1048576
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.ended = False
+        self.error = None
+        self.closed = False
+
+    def feed(self, data):
+        with self.condition:
+            while self.buffered >= self.max_buffered and not self.closed:
+                self.condition.wait()
+
+            # Output nobody reads any more is dropped
+            if self.closed:
+                return
+
+            self.chunks.append(data)
+            self.buffered += len(data)
+            self.condition.notify_all()
+
+    def end(self, error=None):
+        with self.condition:
+            self.error = error
+            self.ended = True
+            self.condition.notify_all()
+
+    def readinto(self, buffer):
+        with self.condition:
+            while not self.chunks and not self.ended:
+                self.condition.wait()
+
+            if not self.chunks:
+                if self.error:
+                    raise AgentError(self.error)
+                return 0
+
+            data = self.chunks[0]
+            count = min(len(buffer), len(data))
+            buffer[:count] = data[:count]
+            if count == len(data):
+                self.chunks.popleft()
+            else:
+                self.chunks[0] = data[count:]
+
+            self.buffered -= count
+            self.condition.notify_all()
+            return count
+
+    readinto1 = readinto
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.chunks.clear()
+            self.buffered = 0
+            self.condition.notify_all()
+
+
+class RemoteProcess:
+    """A case running on an agent, behaving like a Popen"""
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.stdout = RemoteStream()
+        self.returncode = None
+        self.exited = threading.Event()
+
+    def exit(self, status):
+        self.returncode = status.get('returncode')
+        self.stdout.end(status.get('error'))
+        self.exited.set()
+
+    def kill(self):
+        if not self.exited.is_set():
+            self.connection.send(self.channel, KILL)
+
+    def wait(self):
+        self.exited.wait()
+        return self.returncode
+
+
+class AgentConnection:
+    """A persistent connection to an agent
+
+    Multiplexes the cases of all executors using the agent over a single
+    socket, with a thread receiving the output of all of them.
+
+    Parameters
+    ----------
+    address : A (host, port) tuple or the path of a Unix socket.
+    """
+
+    lock = threading.Lock()
+    connections = {}
+
+    def __init__(self, address):
+        self.address = address
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX)
+            self.socket.connect(address)
+        else:
+            self.socket = socket.create_connection(address)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Agents listening on TCP require the shared token first
+        if token is not None:
+            self.socket.sendall(frame(0, AUTH, token))
+
+        self.reader = self.socket.makefile('rb')
+        self.send_lock = threading.Lock()
+        self.channels = itertools.count(1)
+        self.processes = {}
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.receive)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @classmethod
+    def get(cls, resource):
+        """Get the pooled connection to the agent of a resource,
+        connecting if there is no open connection"""
+        address = parse_address(resource)
+        with cls.lock:
+            connection = cls.connections.get(address)
+            if connection is None or connection.closed:
+                connection = AgentConnection(address)
+                cls.connections[address] = connection
+
+        return connection
+
+    def send(self, channel, frame_type, payload=b''):
+        with self.send_lock:
+            self.socket.sendall(frame(channel, frame_type, payload))
+
+    def spawn(self, command, environment=None, session=False):
+        """Start a case on the agent, returning a RemoteProcess"""
+        process = RemoteProcess(self, next(self.channels))
+        request = {'command': command, 'environment': environment,
+                   'session': session}
+
+        # However the agent dropped the connection, the case fails the
+        # same way as the cases running when it was dropped
+        with self.send_lock:
+            if self.closed:
+                raise AgentError(self.lost())
+            # Registered before sending, the agent may answer at once
+            self.processes[process.channel] = process
+            try:
+                self.socket.sendall(frame(process.channel, RUN,
+                                          json.dumps(request).encode()))
+            except OSError:
+                self.processes.pop(process.channel, None)
+                raise AgentError(self.lost())
+
+        return process
+
+    def lost(self):
+        return "Connection to agent " + str(self.address) + " lost"
+
+    def receive(self):
+        try:
+            while True:
+                data = self.reader.read(header.size)
+                if len(data) < header.size:
+                    break
+                (channel, frame_type, length) = header.unpack(data)
+                payload = self.reader.read(length)
+
+                process = self.processes.get(channel)
+                if process is None:
+                    continue
+
+                if frame_type == OUTPUT:
+                    process.stdout.feed(payload)
+                elif frame_type == EXIT:
+                    del self.processes[channel]
+                    process.exit(json.loads(payload))
+        except OSError:
+            pass
+
+        with self.send_lock:
+            self.closed = True
+            processes = list(self.processes.values())
+            self.processes.clear()
+            self.reader.close()
+            self.socket.close()
+
+        for process in processes:
+            process.exit({'error': self.lost()})
@@ -14,39 +14,221 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import heapq
+import math
 import queue
-from .executor import Executor
+import time
+from .executor import Executor, ResultBatcher
 from .test import TestExecutionResult
+from .case import Case, CaseExecutionResult
+from .dependency import DependencyGraph
+from . import timing
 import logging
 
+class Repetitions:
+    """The repetitions of the tests handed out by a scheduler
+
+    Each repetition of a test is handed out on its own, so that the
+    repetitions run concurrently on all free resources. Once a test has
+    failed max_failures times its remaining repetitions are dropped.
+
+    Parameters
+    ----------
+    max_failures : The number of failed runs after which a test is no
+                   longer repeated, None to run all repetitions.
+    """
+
+    def __init__(self, max_failures=None):
+        self.max_failures = max_failures
+        self.remaining = {}
+        self.running = {}
+        self.failures = {}
+        self.dropped = 0
+
+    def __call__(self, tests):
+        """Generate each repetition of the tests, lazily so that the
+        failures of the first repetitions stop the later ones"""
+        for test in tests:
+            self.remaining[id(test)] = test.repetitions()
+            self.running[id(test)] = 0
+            self.failures[id(test)] = 0
+
+            for repetition in range(test.repetitions()):
+                if self.stopped(test):
+                    break
+                yield test
+
+    def stopped(self, test):
+        """Whether the repetitions of a test have been dropped"""
+        return self.remaining[id(test)] == 0
+
+    def started(self, test):
+        self.remaining[id(test)] -= 1
+        self.running[id(test)] += 1
+
+    def completed(self, result):
+        """Register the result of a run of a test, returning whether all
+        runs of the test are done"""
+        test = result.test
+        self.running[id(test)] -= 1
+
+        if not result.passed():
+            self.failures[id(test)] += 1
+            if (self.max_failures is not None and
+                    self.failures[id(test)] >= self.max_failures and
+                    self.remaining[id(test)] > 0):
+                logging.debug("Dropping %d repetitions of %s" %
+                              (self.remaining[id(test)], str(test)))
+                self.dropped += self.remaining[id(test)]
+                self.remaining[id(test)] = 0
+
+        return self.remaining[id(test)] == 0 and self.running[id(test)] == 0
+
+
+def percentile(values, fraction):
+    """Get the nearest rank percentile of a list of values"""
+    values = sorted(values)
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def repetition_summary(suite):
+    """Generate summary lines of the cases run more than once, their
+    pass rate and duration percentiles"""
+    for test in suite.test_list:
+        if hasattr(test, 'test_list'):
+            yield from repetition_summary(test)
+            continue
+
+        runs = test.execution_results
+        if len(runs) < 2:
+            continue
+
+        passed = sum(1 for result in runs if result.passed())
+        line = ("%s: passed %d of %d runs (%.0f%%)" %
+                (test.name, passed, len(runs), 100 * passed / len(runs)))
+
+        durations = [result.duration for result in runs
+                     if result.duration is not None]
+        if durations:
+            line += (", duration p50 %.2f s, p90 %.2f s, max %.2f s" %
+                     (percentile(durations, 0.5),
+                      percentile(durations, 0.9), max(durations)))
+
+        # Test lines which both passed and failed
+        flaky = sum(1 for rate in test.generate_result().pass_rates()
+                    if 0 < rate < 1)
+        if flaky:
+            line += ", %d flaky test lines" % flaky
+
+        yield line
+
+
 class Scheduler:
+    """The simple scheduler
+
+    Hands out the tests in suite order to a free resource, preferring
+    the one on which most dependencies of the test have already been
+    run. If a DurationHistory is given the durations of all executed
+    cases are recorded in it. Repeated tests are handed out once per
+    repetition."""
+
+    # The failed runs after which a test is no longer repeated, if any
+    max_failures = None
 
-    def __init__(self, resources, suite, output):
+    def __init__(self, resources, suite, output, executor_class=Executor,
+                 history=None):
         self.resources = resources
         self.suite = suite
         self.output = output
+        self.history = history
+        self.dependency_graph = DependencyGraph(suite)
+        self.repetitions = Repetitions(self.max_failures)
+
+        # RunMetrics counting the progress of the run, if any
+        self.metrics = None
 
         self.result_queue = queue.Queue()
 
+        # When to next flush the results batched by the executors
+        self.flush_deadline = 0.0
+
         self.executors = {}
         for resource in resources:
-            self.executors[resource] = Executor(resource, self.result_queue)
+            self.executors[resource] = executor_class(resource,
+                                                      self.result_queue)
             self.executors[resource].start()
 
         self.scheduled_tests = {}
+        self.completed_dependencies = {}
         for resource in resources:
             self.scheduled_tests[resource] = None
+            self.completed_dependencies[resource] = set()
 
     def wait_for_free_resource(self):
         while True:
-            result = self.result_queue.get()
-            self.output(result)
+            try:
+                result = self.result_queue.get(timeout=ResultBatcher.latency)
+            except queue.Empty:
+                result = None
+
+            # Collect the results the executors hold back in batches, also
+            # while other executors keep the queue busy
+            now = time.monotonic()
+            if result is None or now >= self.flush_deadline:
+                for executor in self.executors.values():
+                    executor.flush_results()
+                self.flush_deadline = now + ResultBatcher.latency
 
-            if isinstance(result, TestExecutionResult):
-                resource = str(result.executor)
-                if result.test == self.scheduled_tests[resource]:
-                    self.scheduled_tests[resource] = None
-                    return resource
+            if result is None:
+                continue
+
+            if timing.profile:
+                start = time.perf_counter()
+                resource = self.handle_message(result)
+                timing.profile.add('result handling',
+                                   time.perf_counter() - start)
+            else:
+                resource = self.handle_message(result)
+
+            if resource is not None:
+                return resource
+
+    def handle_message(self, message):
+        """Handle a result or batch of results from an executor
+
+        Returns the resource freed by the message, if any."""
+        if isinstance(message, list):
+            for tap in message:
+                self.handle_result(tap)
+            if self.metrics:
+                self.metrics.record_lines(len(message))
+            return None
+
+        self.handle_result(message)
+
+        if isinstance(message, TestExecutionResult):
+            resource = str(message.executor)
+            if message.test is self.scheduled_tests[resource]:
+                self.scheduled_tests[resource] = None
+                if self.metrics:
+                    self.metrics.record_completed()
+                if self.repetitions.completed(message):
+                    self.output.finished(message.test)
+                return resource
+
+        return None
+
+    def handle_result(self, result):
+        """Handle a result from an executor"""
+        self.output(result)
+
+        if self.metrics and isinstance(result, CaseExecutionResult):
+            self.metrics.record_case(result)
+
+        if (self.history and isinstance(result, CaseExecutionResult) and
+                result.duration is not None):
+            self.history.record(result.test, result.duration)
 
     def get_free_resources(self):
         """Get a list of free resources available to this scheduler"""
@@ -63,23 +245,249 @@ class Scheduler:
         # Otherwise wait for a resource to become free
         return [ self.wait_for_free_resource() ]
 
+    def choose_resource(self, free_resources, test):
+        """Choose the free resource with the most dependencies of a test
+        already run, the first one if no resource has any"""
+        if not self.dependency_graph.requirements(test):
+            return free_resources[0]
+
+        return max(free_resources, key=lambda resource:
+                   self.dependency_graph.satisfied(
+                       test, self.completed_dependencies[resource]))
+
     def schedule_test(self, resource, test):
         """Schedule a test on a specific resource"""
+        # The start is recorded before the test is published to the
+        # metrics, which read the scheduled tests concurrently
+        if self.metrics:
+            self.metrics.scheduled(resource)
         self.scheduled_tests[resource] = test
+        self.repetitions.started(test)
+        self.completed_dependencies[resource] |= \
+            self.dependency_graph.requirements(test)
         self.executors[resource].queue(test)
 
+    def order(self, tests):
+        """Order the tests to hand out, suite order for this scheduler
+
+        Schedulers handing out tests in another order overload this."""
+        return tests
+
+    def run(self, tests):
+        """Hand out every repetition of the tests in order and wait for
+        all of them to complete"""
+        for test in self.repetitions(tests):
+            free_resources = self.get_free_resources()
+
+            # Failures while waiting may have dropped the repetition
+            if self.repetitions.stopped(test):
+                continue
+
+            resource = self.choose_resource(free_resources, test)
+            logging.debug("Scheduling %s on %s" % (str(test), resource))
+            self.schedule_test(resource, test)
+
+        # Wait for all the resources to become free
+        while set(self.resources) != set(self.get_free_resources()):
+            self.wait_for_free_resource()
+
     def __call__(self):
         """Start scheduling tests
 
         This is a simple scheduler method that other schedulers
         should overload to implement better scheduling algorithms."""
+        self.run(self.order(list(self.suite)))
+        self.terminate()
+
+    def terminate(self):
+        """Terminate all executors and wait for them to finish"""
+        for executor in self.executors.values():
+            executor.terminate()
+
+        for executor in self.executors.values():
+            executor.join()
 
-        # Run all the tests
-        for test in self.suite:
-            free_resources = self.get_free_resources()
-            logging.debug("Scheduling %s on %s" % (str(test), str(free_resources[0])))
-            self.schedule_test(free_resources[0], test)
+
+def any_ordered_group(test):
+    """Get the outermost suite in which a test may run in any order
+
+    Returns None if the parent suite of the test is sequential."""
+    group = None
+    parent = getattr(test, 'parent', None)
+    while parent is not None and parent.ordering == 'any':
+        group = parent
+        parent = parent.parent
+
+    return group
+
+
+class LongestFirstScheduler(Scheduler):
+    """A scheduler running the longest tests first
+
+    Tests from suites with any ordering are handed out by their expected
+    duration according to the DurationHistory, longest first, so that a
+    long test does not start last and finish alone. Tests of sequential
+    suites keep their order. The predicted and the actual makespan are
+    added to the execution summary."""
+
+    def expected_duration(self, test):
+        if isinstance(test, Case):
+            return self.history.estimate(test)
+
+        # Sequential suites are run as one test
+        return sum(self.expected_duration(suite_test) *
+                   suite_test.repetitions(within=test)
+                   for suite_test in test.test_list)
+
+    def order(self, tests):
+        """Order the tests of any ordered suites, longest first"""
+        ordered = []
+        group = []
+        group_suite = None
+
+        for test in tests:
+            suite = any_ordered_group(test)
+
+            if group and suite is not group_suite:
+                group.sort(key=self.expected_duration, reverse=True)
+                ordered.extend(group)
+                group = []
+
+            if suite is None:
+                ordered.append(test)
+            else:
+                group.append(test)
+                group_suite = suite
+
+        group.sort(key=self.expected_duration, reverse=True)
+        ordered.extend(group)
+
+        return ordered
+
+    def predict_makespan(self, tests):
+        """Predict the makespan by handing out the tests in order to the
+        resource which becomes free first, each repetition on its own,
+        running dependencies once per resource"""
+        finish_times = [(0.0, i) for i in range(len(self.resources))]
+        completed_dependencies = [set() for resource in self.resources]
+
+        for test in tests:
+            for repetition in range(test.repetitions()):
+                (finish, i) = heapq.heappop(finish_times)
+
+                for (dep, key) in zip(test.dependencies,
+                                      test.dependency_keys()):
+                    if key not in completed_dependencies[i]:
+                        completed_dependencies[i].add(key)
+                        finish += self.expected_duration(dep)
+
+                finish += self.expected_duration(test)
+                heapq.heappush(finish_times, (finish, i))
+
+        return max(finish_times)[0]
+
+    def __call__(self):
+        tests = self.order(list(self.suite))
+        predicted = self.predict_makespan(tests)
+
+        start = time.monotonic()
+        self.run(tests)
+        actual = time.monotonic() - start
+
+        self.terminate()
+
+        self.output.summarize("Predicted makespan: %.1f s, actual: %.1f s" %
+                              (predicted, actual))
+
+
+class WorkStealingScheduler(Scheduler):
+    """A work stealing scheduler
+
+    The tests are dealt out up front, in contiguous blocks so that tests
+    sharing dependencies stay together, to a deque per resource. A free
+    resource takes the next test from the front of its own deque and,
+    once that is empty, steals from the back of the deque of the
+    resource with the most tests left. Sequential suites are stolen as
+    a whole. Resource utilization is added to the execution summary."""
+
+    def deal(self, tests):
+        """Deal the tests out to the deques of the resources"""
+        self.deques = {}
+        for resource in self.resources:
+            self.deques[resource] = collections.deque()
+
+        block = -(-len(tests) // len(self.resources))
+        for (i, test) in enumerate(tests):
+            self.deques[self.resources[i // block]].append(test)
+
+    def next_test(self, resource):
+        """Get the next test for a resource, skipping tests of which the
+        repetitions have been dropped"""
+        while True:
+            test = self.take_test(resource)
+            if test is None or not self.repetitions.stopped(test):
+                return test
+
+    def take_test(self, resource):
+        """Take the next test for a resource, stealing if needed"""
+        if self.deques[resource]:
+            return self.deques[resource].popleft()
+
+        victim = max(self.resources, key=lambda r: len(self.deques[r]))
+        if self.deques[victim]:
+            self.stolen[resource] += 1
+            return self.deques[victim].pop()
+
+        return None
+
+    def schedule_test(self, resource, test):
+        self.started[resource] = time.monotonic()
+        self.ran[resource] += 1
+        Scheduler.schedule_test(self, resource, test)
+
+    def wait_for_free_resource(self):
+        resource = Scheduler.wait_for_free_resource(self)
+        self.busy[resource] += time.monotonic() - self.started[resource]
+        return resource
+
+    def __call__(self):
+        self.deal(list(self.repetitions(self.suite)))
+
+        self.started = dict.fromkeys(self.resources, 0.0)
+        self.busy = dict.fromkeys(self.resources, 0.0)
+        self.ran = dict.fromkeys(self.resources, 0)
+        self.stolen = dict.fromkeys(self.resources, 0)
+
+        start = time.monotonic()
+
+        while any(self.deques.values()):
+            for resource in self.get_free_resources():
+                test = self.next_test(resource)
+                if test is None:
+                    break
+                logging.debug("Scheduling %s on %s" % (str(test), resource))
+                self.schedule_test(resource, test)
 
         # Wait for all the resources to become free
         while set(self.resources) != set(self.get_free_resources()):
             self.wait_for_free_resource()
+
+        makespan = time.monotonic() - start
+
+        self.terminate()
+        self.summarize_utilization(makespan)
+
+    def summarize_utilization(self, makespan):
+        if makespan <= 0:
+            return
+
+        busy = sum(self.busy.values())
+        self.output.summarize("Utilization: %.0f%% of %d resources over %.1f s"
+                              % (100 * busy / (makespan * len(self.resources)),
+                                 len(self.resources), makespan))
+
+        for resource in self.resources:
+            self.output.summarize("%s: busy %.0f%%, ran %d, stole %d" %
+                                  (resource,
+                                   100 * self.busy[resource] / makespan,
+                                   self.ran[resource], self.stolen[resource]))
@@ -0,0 +1,169 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import bisect
+import collections
+import os
+import pickle
+import tempfile
+import threading
+from .tap import pack, unpack
+
+
+class TapSegment:
+    """An append-only file of spilled TAP records
+
+    Shared by the TapStores of all case execution results of a run. At
+    most max_resident records of all stores are held in memory, beyond
+    that the records of the store which was appended to least recently
+    are spilled to the file. The last chunk read back for indexing is
+    cached, once for all stores, and counted among the resident records.
+
+    Parameters
+    ----------
+    max_resident : The number of records held in memory.
+    directory : The directory of the file, the default temporary
+                directory if None. The file is deleted once closed.
+    """
+
+    def __init__(self, max_resident, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.size = 0
+        self.max_resident = max_resident
+        self.resident = 0
+        self.stores = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+        # The store and chunk number of the cached chunk, and its records
+        self.cached_store = None
+        self.cached_index = None
+        self.cached_records = []
+
+    def store(self):
+        """Create a TapStore spilling to this segment"""
+        return TapStore(self)
+
+    def write(self, records):
+        """Append packed records, returning their offset and length"""
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+        offset = self.size
+        os.pwrite(self.file.fileno(), data, offset)
+        self.size += len(data)
+        return (offset, len(data))
+
+    def read(self, offset, length):
+        return pickle.loads(os.pread(self.file.fileno(), length, offset))
+
+    def read_cached(self, store, i):
+        """Read a chunk of a store through the cache. Called with the
+        segment locked."""
+        if self.cached_store is not store or self.cached_index != i:
+            self.resident -= len(self.cached_records)
+            self.cached_records = self.read(*store.chunks[i])
+            self.cached_store = store
+            self.cached_index = i
+            self.resident += len(self.cached_records)
+            self.make_room()
+
+        return self.cached_records
+
+    def appended(self, store, count):
+        """Account for records appended to a store"""
+        self.resident += count
+        self.stores[id(store)] = store
+        self.stores.move_to_end(id(store))
+        self.make_room()
+
+    def make_room(self):
+        """Spill the least recently appended stores while beyond the
+        limit"""
+        while self.resident > self.max_resident and self.stores:
+            (key, oldest) = self.stores.popitem(last=False)
+            self.resident -= oldest.spill()
+
+    def close(self):
+        self.file.close()
+
+
+class TapStore:
+    """A list of Tap objects which spills to a TapSegment
+
+    Supports appending, iteration, indexing and comparison like the
+    list it replaces, reading spilled records back from the segment as
+    they are needed."""
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.buffer = []
+        self.spilled = 0
+        # The position, offset and length of each spilled chunk
+        self.starts = []
+        self.chunks = []
+
+    def append(self, tap):
+        with self.segment.lock:
+            self.buffer.append(tap)
+            self.segment.appended(self, 1)
+
+    def spill(self):
+        """Write the records in memory to the segment, returning their
+        number. Called with the segment locked."""
+        count = len(self.buffer)
+        if count:
+            chunk = self.segment.write([pack(tap) for tap in self.buffer])
+            self.starts.append(self.spilled)
+            self.chunks.append(chunk)
+            self.spilled += count
+            self.buffer = []
+
+        return count
+
+    def __len__(self):
+        return self.spilled + len(self.buffer)
+
+    def __getitem__(self, position):
+        with self.segment.lock:
+            if position < 0:
+                position += len(self)
+            if position < 0 or position >= len(self):
+                raise IndexError("TapStore index out of range")
+
+            if position >= self.spilled:
+                return self.buffer[position - self.spilled]
+
+            i = bisect.bisect_right(self.starts, position) - 1
+            records = self.segment.read_cached(self, i)
+            return unpack(records[position - self.starts[i]])
+
+    def __iter__(self):
+        with self.segment.lock:
+            chunks = len(self.chunks)
+            buffer = list(self.buffer)
+            spilled = self.spilled
+
+        # Chunks are only held while iterated over, never cached
+        for i in range(chunks):
+            with self.segment.lock:
+                records = self.segment.read(*self.chunks[i])
+            for record in records:
+                yield unpack(record)
+
+        for tap in buffer:
+            yield tap
+
+    def __eq__(self, other):
+        return list(self) == list(other)
@@ -15,6 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import yaml
+import concurrent.futures
+import io
 import os
 from .case import Case, looks_like_a_case
 from xml.etree.ElementTree import Element
@@ -27,10 +29,16 @@ class SuiteExecutionResult(TestExecutionResult):
     def __init__(self, suite):
         TestExecutionResult.__init__(self, suite)
         self.suite = suite
+        self.execution_results = []
 
     def append(self, execution_result):
         self.execution_results.append(execution_result)
 
+    def passed(self):
+        """Whether all tests of the suite run passed"""
+        return self.failed is None and \
+            all(result.passed() for result in self.execution_results)
+
 
 class SuiteResult(TestResult):
     """The aggregated result of a test suite"""
@@ -91,6 +99,7 @@ class Suite(Test):
         self.parent = parent
         self.sequence = sequence
         self.ordering = 'sequential'
+        self.cached_junit_name = None
 
     def __eq__(self, other):
         return (self.name == other.name and
@@ -99,6 +108,14 @@ class Suite(Test):
                 self.test_list == self.test_list and
                 self.ordering == self.ordering)
 
+    def dependency_key(self):
+        """A hashable key, equal for equal suites"""
+        if self.cached_dependency_key is None:
+            self.cached_dependency_key = ('suite', self.name,
+                                          self.dependency_keys())
+
+        return self.cached_dependency_key
+
     def append_test(self, test):
         self.test_list.append(test)
 
@@ -111,6 +128,10 @@ class Suite(Test):
         if not self.parent:
             return None
 
+        # The name only depends on the parsed tree, compute it once
+        if self.cached_junit_name is not None:
+            return self.cached_junit_name
+
         junit_name = ""
 
         if self.parent:
@@ -127,6 +148,7 @@ class Suite(Test):
         basename = basename[0:basename.find('.')]
         junit_name += count_str + '_' + basename
 
+        self.cached_junit_name = junit_name
         return junit_name
 
     def generate_result(self):
@@ -134,35 +156,64 @@ class Suite(Test):
         self.result = SuiteResult(self, test_results)
         return self.result
 
-    def __call__(self, parser, resource):
+    def __call__(self, parser, resource, replay=True):
         """Run the test suite
 
         Executing one test case at a time and yielding each result.
         Retain the hierarchy of suites and cases by only saving
         the exection results from tests and suites inside the current
-        suite.
+        suite. Cached results are only replayed if replay is set.
         """
         execution_result = SuiteExecutionResult(self)
 
-        for test in self:
-            for result in test(parser, resource):
-                try:
-                    if result.test in self.test_list:
-                        execution_result.append(result)
-                except:
-                    pass
+        for test in self.repeated():
+            for result in test(parser, resource, replay):
+                if (isinstance(result, TestExecutionResult) and
+                        any(result.test is test for test in self.test_list)):
+                    execution_result.append(result)
+
+                yield(result)
+
+        yield(execution_result)
+
+    async def run_async(self, parser, resource, replay=True):
+        """Run the test suite on an asyncio event loop
+
+        The asyncio counterpart of calling the suite."""
+        execution_result = SuiteExecutionResult(self)
+
+        for test in self.repeated():
+            async for result in test.run_async(parser, resource, replay):
+                if (isinstance(result, TestExecutionResult) and
+                        any(result.test is test for test in self.test_list)):
+                    execution_result.append(result)
 
                 yield(result)
 
         yield(execution_result)
 
+    def execution_failed(self, reason):
+        result = SuiteExecutionResult(self)
+        result.failed = reason
+        return result
+
+    def repeated(self):
+        """Generate the tests as run by the suite, each repetition of a
+        test in turn"""
+        for test in self:
+            for repetition in range(test.repetitions(within=self)):
+                yield test
+
     def __iter__(self):
         for test in self.test_list:
-            # Only suites have ordering
+            # Only suites have ordering, sequential suites are run as
+            # a single test.
             try:
                 if test.ordering == 'any':
                     for suite_test in test:
                         yield suite_test
+                else:
+                    yield test
             except AttributeError:
                 yield test
 
@@ -198,6 +249,128 @@ def validate_ordering(ordering):
     return ordering.lower()
 
 
+def validate_repeat(repeat):
+    if isinstance(repeat, bool) or not isinstance(repeat, int):
+        raise SuiteParseException("Expected a number of runs as repeat")
+    if repeat < 1:
+        raise SuiteParseException("Tests must be run at least once")
+    return repeat
+
+
+def validate_timeout(timeout):
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        raise SuiteParseException("Expected a number of seconds as timeout")
+    if timeout <= 0:
+        raise SuiteParseException("Timeouts must be positive")
+    return timeout
+
+
+# The libyaml loader is much faster, but is not always available
+yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# The number of processes reading and parsing sibling suite files
+# concurrently. The parsed yaml is plain data, which is sent back to
+# be assembled into the tree in sequence order.
+load_workers = 1
+
+# The processes loading suite files, created on first use
+load_pool = None
+
+
+def read_file(file):
+    with open(file) as f:
+        return f.read()
+
+
+def load_yaml(file):
+    # Name the stream after the file, parse errors refer to it
+    stream = io.StringIO(read_file(file))
+    stream.name = file
+    return yaml.load(stream, Loader=yaml_loader)
+
+
+def load_yaml_in_worker(files):
+    """Load a batch of suite files in a worker process
+
+    Errors do not survive being sent back, a file which fails to load
+    gives None and is loaded again to raise the error."""
+    loaded = []
+    for file in files:
+        try:
+            loaded.append(load_yaml(file))
+        except (OSError, yaml.YAMLError):
+            loaded.append(None)
+
+    return loaded
+
+
+class LoadedSuite:
+    """The parsed yaml of a suite file loaded as part of a batch
+
+    Parameters
+    ----------
+    batch : The future of the parsed yaml of the files of the batch.
+    index : The index of the file in the batch.
+    """
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def result(self):
+        return self.batch.result()[self.index]
+
+
+def prefetch_suites(yaml_tests, dir):
+    """Start loading the suite files in a list of tests
+
+    The suite files are split in a batch per worker, as a task per file
+    costs about as much as parsing it with libyaml. Returns a list with
+    a LoadedSuite for each suite, and None for anything else, in the
+    order of the tests."""
+    global load_pool
+
+    futures = [None] * len(yaml_tests)
+    if load_workers <= 1:
+        return futures
+
+    if load_pool is None:
+        load_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=load_workers)
+
+    suites = []
+    for (i, test) in enumerate(yaml_tests):
+        if isinstance(test, dict) and test:
+            test = next(reversed(test))
+        if not isinstance(test, str):
+            continue
+
+        if (dir != ''):
+            test = os.path.normpath(dir + "/" + test)
+
+        if looks_like_a_suite(test):
+            suites.append((i, test))
+
+    batch_size = max(-(-len(suites) // load_workers), 1)
+    for start in range(0, len(suites), batch_size):
+        batch = suites[start:start + batch_size]
+        future = load_pool.submit(load_yaml_in_worker,
+                                  [file for (i, file) in batch])
+        for (index, (i, file)) in enumerate(batch):
+            futures[i] = LoadedSuite(future, index)
+
+    return futures
+
+
+def close_load_pool():
+    """Stop the processes loading suite files, once all are parsed"""
+    global load_pool
+
+    if load_pool is not None:
+        load_pool.shutdown()
+        load_pool = None
+
+
 def parse_yaml_tests(yaml_tests, dir, parent, sequence, dependencies=[]):
     """
     Parse a list of tests from the parsed yaml
@@ -210,11 +383,16 @@ def parse_yaml_tests(yaml_tests, dir, parent, sequence, dependencies=[]):
     if not isinstance(yaml_tests, list):
         raise SuiteParseException("Expected a list of tests")
 
+    # Sibling suites are loaded concurrently, but assembled in order
+    loaded_suites = prefetch_suites(yaml_tests, dir)
     tests = []
 
-    for test in yaml_tests:
+    for (i, test) in enumerate(yaml_tests):
 
         arguments = None
+        timeout = None
+        idle_timeout = None
+        repeat = 1
 
         # Tests are either a single entry in yaml, or they are multiple entries
         # inside a dict where the key is the path to the test-case.
@@ -225,6 +403,12 @@ def parse_yaml_tests(yaml_tests, dir, parent, sequence, dependencies=[]):
             test, parameters = test_dict.popitem()
             if 'arguments' in parameters:
                 arguments = parameters['arguments'].split(' ')
+            if 'timeout' in parameters:
+                timeout = validate_timeout(parameters['timeout'])
+            if 'idle_timeout' in parameters:
+                idle_timeout = validate_timeout(parameters['idle_timeout'])
+            if 'repeat' in parameters:
+                repeat = validate_repeat(parameters['repeat'])
 
         else:
             raise SuiteParseException("Unexpected test format")
@@ -234,10 +418,14 @@ def parse_yaml_tests(yaml_tests, dir, parent, sequence, dependencies=[]):
             test = os.path.normpath(dir + "/" + test)
 
         if looks_like_a_suite(test):
-            tests.append(parse_yaml_suite(test, parent, sequence,
-                                          dependencies))
+            suite = parse_yaml_suite(test, parent, sequence, dependencies,
+                                     loaded_suites[i])
+            suite.repeat = repeat
+            tests.append(suite)
         elif looks_like_a_case(test):
-            tests.append(Case(test, parent, sequence, arguments, dependencies))
+            tests.append(Case(test, parent, sequence, arguments, dependencies,
+                              timeout=timeout, idle_timeout=idle_timeout,
+                              repeat=repeat))
         else:
             raise SuiteParseException(test + " does not appear to be a \
                                       case or a suite")
@@ -247,12 +435,14 @@ def parse_yaml_tests(yaml_tests, dir, parent, sequence, dependencies=[]):
     return (tests, sequence)
 
 
-def parse_yaml_suite(file, parent, sequence, dependencies=[]):
+def parse_yaml_suite(file, parent, sequence, dependencies=[], loaded=None):
     """
     Parse a yaml suite recursively.
 
     parent is the parent suite,
     sequence is the number of the test within the parent suite
+    loaded is a future of the parsed yaml of the suite file, if already
+    being loaded
     """
 
     dir = os.path.dirname(file)
@@ -261,11 +451,12 @@ def parse_yaml_suite(file, parent, sequence, dependencies=[]):
 
     suite = Suite(file, parent, sequence)
 
-    suite_dict = yaml.safe_load(open(file))
+    suite_dict = loaded.result() if loaded else None
+    if suite_dict is None:
+        suite_dict = load_yaml(file)
 
     # lowercase all the keys
-    for key in suite_dict.keys():
-        suite_dict[key.lower()] = suite_dict.pop(key)
+    suite_dict = {key.lower(): value for (key, value) in suite_dict.items()}
 
     if 'ordering' in suite_dict:
         suite.ordering = validate_ordering(suite_dict.pop('ordering'))
@@ -276,8 +467,9 @@ def parse_yaml_suite(file, parent, sequence, dependencies=[]):
             parse_yaml_tests(suite_dict.pop('dependencies'), dir, suite,
                              child_sequence)
         # The total dependency list for a suite is always that of the suite
-        # and that of the parent.
-        dependencies += suite_dependencies
+        # and that of the parent. Extend a copy, the list of the parent
+        # is shared with the tests following this suite.
+        dependencies = dependencies + suite_dependencies
 
     if 'tests':
         (tests, child_sequence) = \
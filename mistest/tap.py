@@ -14,16 +14,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import io
+import codecs
+import copy
+import os
 import re
+import sys
+import threading
+import time
 import ply.lex as lex
 import ply.yacc as yacc
 from xml.etree.ElementTree import Element
-import unittest
 
 
 class Tap:
-    pass
+    # Set by the executor which reported the Tap object
+    __slots__ = ('resource', 'executor')
 
 
 # Tap output classes
@@ -33,6 +38,8 @@ class Plan(Tap):
     Contains the number of planned tests as well
     as a possible diagnostic of the Diagnostic class"""
 
+    __slots__ = ('number', 'diagnostic')
+
     def __init__(self, number, diagnostic=None):
         self.number = number
         self.diagnostic = diagnostic
@@ -60,6 +67,9 @@ class TestLine(Tap):
     a number which is the test number in the sequence,
     a description and a directive and directive description."""
 
+    __slots__ = ('ok', 'number', 'description', 'directive',
+                 'directive_description')
+
     def __init__(self, ok, number, description=None,
                  directive=None, directive_description=None):
         self.ok = ok
@@ -105,6 +115,8 @@ class Diagnostic(Tap):
 
     Typically a comment from the test case relating progress information."""
 
+    __slots__ = ('diagnostic',)
+
     def __init__(self, diagnostic):
         self.diagnostic = diagnostic
 
@@ -117,6 +129,41 @@ class Diagnostic(Tap):
         return element
 
 
+# The upper case directive names by their spelling in the TAP stream,
+# shared by all test lines instead of a string per line
+directive_names = {}
+
+
+def directive_name(directive):
+    """Get the interned upper case name of a directive"""
+    name = directive_names.get(directive)
+    if name is None:
+        name = directive_names[directive] = sys.intern(directive.upper())
+
+    return name
+
+
+def pack(tap):
+    """Pack a Tap object into a compact tuple"""
+    if isinstance(tap, TestLine):
+        return (tap.ok, tap.number, tap.description, tap.directive,
+                tap.directive_description)
+    elif isinstance(tap, Plan):
+        return (tap.number, tap.diagnostic)
+    else:
+        return tap.diagnostic
+
+
+def unpack(record):
+    """Unpack a tuple created by pack into a Tap object"""
+    if isinstance(record, str):
+        return Diagnostic(record)
+    elif len(record) == 2:
+        return Plan(record[0], record[1])
+    else:
+        return TestLine(*record)
+
+
 # Tap error classes
 class NumberingError(Exception):
     """Raised when tests are not executed with the correct ordering"""
@@ -152,17 +199,13 @@ class PlanError(Exception):
     pass
 
 
-# Tap parser
-class Parser:
-    """A TAP Parser module
+# Tap grammar
+class Grammar:
+    """The TAP lexer and grammar rules
 
-    A TAP - Test Anything Protocol - parser intended for parsing the ouput
-    from test cases during execution.
-
-    Parameters
-    ----------
-    input_stream : Input IO stream from which TAP is to be parsed.
-    """
+    The lexer and parser tables built from these rules are shared by all
+    parsers. Rules reach the state of the parser for the current stream
+    through the lexer it passes in, as p.lexer.tap_parser."""
 
     states = (
         ('description', 'exclusive'),
@@ -193,21 +236,21 @@ class Parser:
 
     def t_OK(self, t):
         r'ok'
-        self.lexer.begin('description')
+        t.lexer.begin('description')
         return t
 
     t_NOT = r'not'
 
     def t_HASH(self, t):
         r'\#'
-        self.lexer.begin('text')
+        t.lexer.begin('text')
         return t
 
     t_BAIL = r'[Bb][Aa][Ii][Ll]'
 
     def t_OUT(self, t):
         r'[Oo][Uu][Tt]!'
-        self.lexer.begin('text')
+        t.lexer.begin('text')
         return t
 
     t_ignore = ' \t\r\n'
@@ -232,7 +275,7 @@ class Parser:
 
     def t_description_HASH(self, t):
         r'[ \t]*\#'
-        self.lexer.begin('directive')
+        t.lexer.begin('directive')
         return t
 
     t_description_ignore = '\r\n'
@@ -243,12 +286,12 @@ class Parser:
     # Directive tokens
     def t_directive_TODO(self, t):
         r'[Tt][Oo][Dd][Oo]'
-        self.lexer.begin('text')
+        t.lexer.begin('text')
         return t
 
     def t_directive_SKIP(self, t):
         r'[Ss][Kk][Ii][Pp]'
-        self.lexer.begin('text')
+        t.lexer.begin('text')
         return t
 
     t_directive_ignore = ' \r\n'
@@ -282,25 +325,19 @@ class Parser:
 
     def p_tap_error(self, p):
         """tap : error"""
-        raise NotTapError(self.lexer.lexdata.strip())
+        raise NotTapError(p.lexer.lexdata.strip())
 
     def p_plan(self, p):
         """plan : PLAN
                 | PLAN diagnostic"""
 
-        if self.planned_number:
-            raise NotTapError("Duplicate plan")
-
-        self.planned_number = p[1]
-
-        if self.test_number > self.planned_number:
-            raise PlanError("Number of planned tests (" +
-                            str(self.planned_number) + ") exceeded")
+        tap_parser = p.lexer.tap_parser
+        tap_parser.check_plan(p[1])
 
         if len(p) == 2:
-            p[0] = Plan(self.planned_number, None)
+            p[0] = Plan(tap_parser.planned_number, None)
         elif len(p) == 3:
-            p[0] = Plan(self.planned_number, p[2].diagnostic)
+            p[0] = Plan(tap_parser.planned_number, p[2].diagnostic)
 
     def p_diagnostic(self, p):
         """diagnostic : HASH TEXT"""
@@ -323,20 +360,10 @@ class Parser:
         """number : NUMBER
                   | """
 
-        self.test_number = self.test_number + 1
-
-        if self.planned_number and self.test_number > self.planned_number:
-                raise PlanError("Number of planned tests (" +
-                                str(self.planned_number) + ") exceeded")
-
         if len(p) > 1:
-
-            if p[1] != self.test_number:
-                raise NumberingError("Unexpected test number " + str(p[1]) +
-                                     " expecting " + str(self.test_number))
-            p[0] = p[1]
+            p[0] = p.lexer.tap_parser.check_number(p[1])
         else:
-            p[0] = self.test_number
+            p[0] = p.lexer.tap_parser.check_number()
 
     def p_dash(self, p):
         """dash : DASH
@@ -356,7 +383,7 @@ class Parser:
                      | HASH SKIP description
                      | """
         if len(p) > 3:
-            p[0] = {'directive': p[2].upper(), 'description': p[3]}
+            p[0] = {'directive': directive_name(p[2]), 'description': p[3]}
         else:
             p[0] = {'directive': None, 'description': None}
 
@@ -366,112 +393,277 @@ class Parser:
         else:
             raise NotTapError(p.value)
 
+
+# Tap parser
+class Parser:
+    """A TAP Parser module
+
+    A TAP - Test Anything Protocol - parser intended for parsing the ouput
+    from test cases during execution.
+
+    The lexer and LALR tables are built once per process and shared, each
+    parser only holds the state of the stream it is parsing. The tables
+    are written to the package on first use and loaded from there later.
+
+    Parameters
+    ----------
+    input_stream : Input IO stream from which TAP is to be parsed.
+    """
+
+    tables_lock = threading.Lock()
+    shared_lexer = None
+    shared_parser = None
+
+    # Fast path recognizers for the common line shapes. They only accept
+    # lines which the grammar above would parse to the very same result,
+    # anything else is left to the full ply lexer and parser.
+    fast_test_line = re.compile(
+        r'(not )?ok'
+        r'(?: (\d+)(?: - ([^#^\s\d][^#^\r\n]*?)| ([^#^\s\d\-][^#^\r\n]+?))?'
+        r'| ([^#^\s\d\-][^#^\r\n]*?))?'
+        r'(?: \#[ ]*([Tt][Oo][Dd][Oo]|[Ss][Kk][Ii][Pp])( [^^\r\n]*)?)?'
+        r'[\r\n]*')
+
+    fast_plan = re.compile(r'1\.\.(\d+)(?:[ \t]*\#([^^\r\n]+))?[\r\n]*')
+
+    fast_diagnostic = re.compile(r'\#([^^\r\n]+)[\r\n]*')
+
+    @classmethod
+    def build_tables(cls):
+        """Build the shared lexer and parser unless already built
+
+        The parser tables are installed with the package. If they are
+        missing or stale they are only written back where the package
+        directory is writable, elsewhere they are built in memory."""
+        with cls.tables_lock:
+            if cls.shared_parser is None:
+                grammar = Grammar()
+                directory = os.path.dirname(__file__)
+                cls.shared_lexer = lex.lex(module=grammar, debug=0)
+                cls.shared_parser = yacc.yacc(
+                    module=grammar, debug=0, tabmodule='mistest.parsetab',
+                    outputdir=directory,
+                    write_tables=os.access(directory, os.W_OK))
+
     def __init__(self):
-        self.lexer = lex.lex(module=self, debug=0)
-        self.parser = yacc.yacc(module=self, debug=0)
+        if Parser.shared_parser is None:
+            Parser.build_tables()
+
+        # Only the lexer state and the parser stacks are per stream
+        self.lexer = Parser.shared_lexer.clone()
+        self.lexer.tap_parser = self
+        self.parser = copy.copy(Parser.shared_parser)
+        self.planned_number = None
+        self.test_number = 0
 
     def __call__(self, input_stream):
         self.input_stream = input_stream
         self.planned_number = None
         self.test_number = 0
+        # Seconds spent parsing the stream, for profiling
+        self.parse_time = 0.0
 
         return self
 
-    def __iter__(self):
-        for line in self.input_stream:
-            self.lexer.begin('INITIAL')
-            try:
-                line = line.decode("utf-8")
-            except:
-                pass
-            yield self.parser.parse(line, lexer=self.lexer, debug=0)
+    def check_plan(self, planned_number):
+        """Register the plan, raising if it is a duplicate or already
+        exceeded by the tests run so far"""
+        if self.planned_number:
+            raise NotTapError("Duplicate plan")
+
+        self.planned_number = planned_number
+
+        if self.test_number > self.planned_number:
+            raise PlanError("Number of planned tests (" +
+                            str(self.planned_number) + ") exceeded")
+
+    def check_number(self, number=None):
+        """Advance the test number, returning the number of the test
 
+        Raises if the plan is exceeded or if an explicit test number
+        is out of sequence."""
+        self.test_number = self.test_number + 1
+
+        if self.planned_number and self.test_number > self.planned_number:
+                raise PlanError("Number of planned tests (" +
+                                str(self.planned_number) + ") exceeded")
+
+        if number is not None and number != self.test_number:
+            raise NumberingError("Unexpected test number " + str(number) +
+                                 " expecting " + str(self.test_number))
+
+        return self.test_number
+
+    def check_complete(self):
+        """Raise if fewer tests than planned were run"""
         if self.planned_number and self.test_number < self.planned_number:
             raise PlanError("Number of executed tests (" +
                             str(self.test_number)
                             + ") less than the number of planned (" +
                             str(self.planned_number) + ")")
 
+    def parse_grammar(self, line):
+        """Parse a line using the full ply grammar"""
+        self.lexer.begin('INITIAL')
+        return self.parser.parse(line, lexer=self.lexer, debug=0)
+
+    def parse_line(self, line):
+        """Parse a single line of TAP
+
+        Plans, diagnostics and test lines of the usual shapes are
+        recognized directly, other lines go through the ply grammar."""
+        if not isinstance(line, str):
+            return self.parse_grammar(line)
+
+        match = self.fast_test_line.fullmatch(line)
+        if match:
+            (not_ok, number, dash_description, description,
+             bare_description, directive, directive_description) = \
+                match.groups()
+
+            if number is not None:
+                number = self.check_number(int(number))
+            else:
+                number = self.check_number()
+
+            if dash_description is not None:
+                description = dash_description
+            elif bare_description is not None:
+                description = bare_description
+
+            if description is not None:
+                description = description.strip()
+
+            if directive is not None:
+                directive = directive_name(directive)
+                if directive_description is not None:
+                    directive_description = directive_description.strip()
+
+            return TestLine(not_ok is None, number, description,
+                            directive, directive_description)
+
+        match = self.fast_diagnostic.fullmatch(line)
+        if match:
+            return Diagnostic(match.group(1).strip())
+
+        match = self.fast_plan.fullmatch(line)
+        if match:
+            self.check_plan(int(match.group(1)))
+            diagnostic = match.group(2)
+            if diagnostic is not None:
+                diagnostic = diagnostic.strip()
+            return Plan(self.planned_number, diagnostic)
+
+        return self.parse_grammar(line)
+
+    def parse_lines(self, lines, taps):
+        """Parse a batch of lines, appending the results to taps"""
+        parse_line = self.parse_line
+        append = taps.append
+        for line in lines:
+            append(parse_line(line))
+
+    def batches(self):
+        """Generate batches of lines from the input stream
+
+        Binary streams are read in blocks, other streams line by line."""
+        if hasattr(self.input_stream, 'readinto'):
+            yield from LineReader(self.input_stream)
+            return
+
+        for line in self.input_stream:
+            try:
+                line = line.decode("utf-8")
+            except:
+                pass
+            yield [line]
+
+    def parse_batch(self, lines):
+        """Generate the TAP of a batch of lines
+
+        Everything parsed before an error in the batch is generated
+        before the error is raised."""
+        taps = []
+        start = time.perf_counter()
+        try:
+            self.parse_lines(lines, taps)
+        except Exception:
+            yield from taps
+            raise
+        finally:
+            self.parse_time += time.perf_counter() - start
+
+        yield from taps
+
+    def __iter__(self):
+        for lines in self.batches():
+            yield from self.parse_batch(lines)
+
+        self.check_complete()
+
+
+class LineReader:
+    """A block reader for TAP input
+
+    Reads large blocks from a binary stream into a reused buffer,
+    decodes them incrementally as UTF-8 and splits them into lines
+    in bulk. Each iteration yields a list of complete lines, without
+    line endings. A partial line at the end of a block is carried over
+    to the next block.
+
+    Blocks read elsewhere, e.g. from an asyncio stream, can be pushed
+    through the same decoding and splitting with feed() and flush().
+
+    Parameters
+    ----------
+    stream : Binary IO stream, typically the stdout pipe of a test case.
+    block_size : The size of the read buffer in bytes.
+    """
+
+    block_size = 65536
+
+    def __init__(self, stream=None, block_size=None):
+        if block_size:
+            self.block_size = block_size
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.partial = []
+
+    def feed(self, data):
+        """Decode a block of data, returning the lines it completes"""
+        text = self.decoder.decode(data)
+        self.partial.append(text)
+        if '\n' not in text:
+            return []
+
+        lines = ''.join(self.partial).split('\n')
+        self.partial = [lines.pop()]
+        return lines
+
+    def flush(self):
+        """Return the last line if it was not terminated"""
+        self.partial.append(self.decoder.decode(b'', True))
+        last = ''.join(self.partial)
+        self.partial = []
+        return [last] if last else []
+
+    def __iter__(self):
+        buffer = bytearray(self.block_size)
+        view = memoryview(buffer)
+
+        # readinto1 does at most one read on the underlying pipe, so
+        # output is handed on as soon as it arrives.
+        read = getattr(self.stream, 'readinto1', self.stream.readinto)
+
+        while True:
+            count = read(buffer)
+            if not count:
+                break
+
+            lines = self.feed(view[:count])
+            if lines:
+                yield lines
 
-class TestParser(unittest.TestCase):
-
-    def run_parser(self, tap_str):
-        f = io.StringIO(tap_str)
-        p = Parser()
-        p(f)
-        last_tap = None
-        for tap in p:
-            last_tap = tap
-
-        return last_tap
-
-    def test_plan(self):
-        plan = self.run_parser("1..0 # all of them\n")
-        self.assertEqual(plan.number, 0)
-        self.assertEqual(plan.diagnostic, "all of them")
-
-    def test_2_ok(self):
-        ok2 = self.run_parser("1..2\n"
-                              "ok 1\n"
-                              "ok 2\n")
-        self.assertTrue(ok2.ok)
-        self.assertEqual(ok2.number, 2)
-        self.assertIsNone(ok2.description)
-        self.assertIsNone(ok2.directive)
-        self.assertIsNone(ok2.directive_description)
-
-    def test_3_nok(self):
-        not_ok3 = self.run_parser("1..3\n"
-                                  "ok 1 Hello\n"
-                                  "ok 2 drat\n"
-                                  "not ok Sometimes\n")
-        self.assertFalse(not_ok3.ok)
-        self.assertEqual(not_ok3.number, 3)
-        self.assertEqual(not_ok3.description, "Sometimes")
-        self.assertIsNone(not_ok3.directive)
-        self.assertIsNone(not_ok3.directive_description)
-
-    def test_todo(self):
-        ok_todo = self.run_parser("ok # ToDo the directive")
-
-        self.assertTrue(ok_todo.ok)
-        self.assertEqual(ok_todo.number, 1)
-        self.assertIsNone(ok_todo.description)
-        self.assertEqual(ok_todo.directive, "TODO")
-        self.assertEqual(ok_todo.directive_description, "the directive")
-
-    def test_skip(self):
-        not_ok_skip = self.run_parser("not ok # skip")
-
-        self.assertFalse(not_ok_skip.ok)
-        self.assertEqual(not_ok_skip.number, 1)
-        self.assertIsNone(not_ok_skip.description)
-        self.assertEqual(not_ok_skip.directive, "SKIP")
-        self.assertIsNone(not_ok_skip.directive_description)
-
-    def test_not_tap(self):
-        with self.assertRaises(NotTapError):
-            self.run_parser("a wtf")
-
-    def test_numbering_error(self):
-        with self.assertRaises(NumberingError):
-            self.run_parser("ok\n"
-                            "ok 3\n")
-
-    def test_plan_error(self):
-        with self.assertRaises(PlanError):
-            self.run_parser("1..1\n"
-                            "ok\n"
-                            "not ok\n")
-
-    def test_bail_out(self):
-        with self.assertRaises(BailOutError):
-            self.run_parser("Bail out!")
-
-    def test_empty_line(self):
-        with self.assertRaises(NotTapError):
-            self.run_parser("\n")
-
-if __name__ == '__main__':
-
-    unittest.main()
+        lines = self.flush()
+        if lines:
+            yield lines
@@ -72,10 +72,46 @@ class Test:
 
     def __init__(self):
         self.dependencies = []
+        self.parent = None
+        self.repeat = 1
+        self.cached_dependency_key = None
+        self.cached_dependency_keys = None
 
     def __eq__(self, other):
         return self.dependencies == other.dependencies
 
+    def repetitions(self, within=None):
+        """The number of times the test is run
+
+        Tests are repeated as often as they themselves, and each suite
+        they are run as part of, are repeated. Suites from within which
+        the test is run, such as the sequential suite running it, are
+        not counted."""
+        count = self.repeat
+        parent = self.parent
+        while parent is not None and parent is not within:
+            count *= parent.repeat
+            parent = parent.parent
+
+        return count
+
+    def execution_failed(self, reason):
+        """Get the result of a run of the test which could not be run"""
+        return TestExecutionResult(self, failed=reason)
+
+    def dependency_keys(self):
+        """The dependency keys of the dependencies of the test
+
+        Computed once, when the dependency graph is built, executors
+        only look them up."""
+        if self.cached_dependency_keys is None:
+            self.cached_dependency_keys = tuple(dep.dependency_key()
+                                                for dep in self.dependencies)
+
+        return self.cached_dependency_keys
+
     def append_dep(self, test):
         if not test in self.dependencies:
             self.dependencies.append(test)
+            self.cached_dependency_key = None
+            self.cached_dependency_keys = None
@@ -0,0 +1,578 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from ..tap import TestLine, Plan, Diagnostic, Parser
+from ..case import Case, CaseExecutionResult
+from ..pool import ParserPool
+from ..executor import (Executor, pending_dependencies,
+                        dependencies_passed)
+from ..dependency import DependencyGraph
+from ..suite import Suite
+from ..engine import AsyncExecutor
+from ..cache import ResultCache
+from ..store import TapSegment
+from ..agent import Agent
+from .. import case
+from .. import remote
+from ..remote import AgentConnection, RemoteStream
+
+
+class FailingParser:
+    """A parser failing after its first test line"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.parse_time = 0
+
+    def fail(self, taps):
+        for tap in taps:
+            yield tap
+            if isinstance(tap, TestLine):
+                raise ValueError("Parser failed")
+
+    def __iter__(self):
+        return self.fail(self.parser)
+
+    def parse_batch(self, lines):
+        return self.fail(self.parser.parse_batch(lines))
+
+    def check_complete(self):
+        self.parser.check_complete()
+
+
+# Misleading name, this tests the Case class.
+class TestMistestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParserPool(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        self.parser = Parser()
+
+    def run_case(self, tap_str, expected_result):
+        case = Case("/bin/echo", None, 1, arguments=['-en', tap_str])
+        expected_result.test = case
+        # Get results until we get the case execution result
+        for result in case(self.parser, "local"):
+            continue
+
+        self.assertEqual(expected_result, result)
+
+        # Running the case on an event loop must give the same result
+        async def run_async():
+            async for result in case.run_async(self.parser, "local"):
+                continue
+            return result
+
+        self.assertEqual(expected_result, asyncio.run(run_async()))
+
+        # So must parsing in a worker process
+        for result in case(self.pool.parser(), "local"):
+            continue
+
+        self.assertEqual(expected_result, result)
+
+        # And spilling all but one line to disk
+        CaseExecutionResult.tap_segment = TapSegment(1)
+        try:
+            for result in case(self.parser, "local"):
+                continue
+
+            self.assertEqual(expected_result, result)
+            self.assertEqual(list(expected_result), list(result))
+            for line in expected_result:
+                self.assertEqual(line, result[line.number])
+        finally:
+            CaseExecutionResult.tap_segment.close()
+            CaseExecutionResult.tap_segment = None
+
+    def test_4_ok(self):
+        expected_result = CaseExecutionResult(None, planned=4, ran=4, ok=4)
+        expected_result.tap_list = [Plan(4, 'all of them'),
+                                    TestLine(True, 1),
+                                    TestLine(True, 2),
+                                    TestLine(True, 3),
+                                    TestLine(True, 4)]
+        self.run_case("1..4 # all of them\n"
+                      "ok\n"
+                      "ok\n"
+                      "ok\n"
+                      "ok",
+                      expected_result)
+
+    def test_3rd_nok(self):
+        expected_result = CaseExecutionResult(None, planned=3, ran=3, ok=2,
+                                              not_ok=1)
+        expected_result.tap_list = \
+            [Plan(3),
+             TestLine(True, 1, description="Hello"),
+             TestLine(True, 2, description="drat"),
+             TestLine(False, 3, description="Sometimes")]
+
+        self.run_case("1..3\n"
+                      "ok 1 Hello\n"
+                      "ok 2 drat\n"
+                      "not ok Sometimes\n", expected_result)
+
+    def test_skip(self):
+        expected_result = CaseExecutionResult(None, ran=1, ok=1, todo=1)
+        expected_result.tap_list = \
+            [TestLine(True, 1, directive="TODO",
+             directive_description="the directive")]
+        self.run_case("ok # ToDo the directive", expected_result)
+
+    def test_not_ok_skip(self):
+        expected_result = CaseExecutionResult(None, ran=1, ok=0,
+                                              not_ok=1, skip=1)
+        expected_result.tap_list = [TestLine(False, 1, directive="SKIP")]
+        self.run_case("not ok # skip", expected_result)
+
+    def not_tap(self):
+        expected_result = \
+            CaseExecutionResult(None,
+                                failed='Non-TAP input was encountered: '
+                                '"a wtf"')
+        self.run_case("a wtf", expected_result)
+
+    def test_bad_plan_too_many(self):
+        expected_result = \
+            CaseExecutionResult(None, planned=1, ran=1, ok=1,
+                                failed="Number of planned tests (1) exceeded")
+        expected_result.tap_list = [Plan(1), TestLine(True, 1)]
+        self.run_case("1..1\n"
+                      "ok 1\n"
+                      "ok 2\n", expected_result)
+
+    def test_bad_plan_too_few(self):
+        expected_result = \
+            CaseExecutionResult(None, planned=3, ran=2, ok=2,
+                                failed="Number of executed tests (2)"
+                                " less than the number of planned (3)")
+        expected_result.tap_list = [Plan(3),
+                                    TestLine(True, 1),
+                                    TestLine(True, 2)]
+        self.run_case("1..3\n"
+                      "ok 1\n"
+                      "ok 2\n", expected_result)
+
+    def test_bad_order(self):
+        expected_result = \
+            CaseExecutionResult(None, ran=1, ok=1,
+                                failed='Unexpected test number 3 expecting 2')
+        expected_result.tap_list = [TestLine(True, 1)]
+        self.run_case("ok\n"
+                      "ok 3\n", expected_result)
+
+    def test_bail_out(self):
+        expected_result = \
+            CaseExecutionResult(None, failed='Bail out!')
+        self.run_case("Bail out!", expected_result)
+
+    def run_watched_case(self, script, **timeouts):
+        case = Case("/bin/sh", None, 1, arguments=['-c', script], **timeouts)
+
+        async def run_async():
+            async for result in case.run_async(self.parser, "local"):
+                continue
+            return result
+
+        results = []
+        for run in [lambda: list(case(self.parser, "local"))[-1],
+                    lambda: asyncio.run(run_async())]:
+            # The background sleep holding the pipe is killed as well,
+            # so the case ends right away.
+            start = time.monotonic()
+            result = run()
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(result.ran, 1)
+            results.append(result.failed)
+
+        return results
+
+    def test_timeout(self):
+        failed = self.run_watched_case("echo 1..2; echo ok; sleep 5 & "
+                                       "while true; do echo '# busy'; "
+                                       "sleep 0.05; done", timeout=0.3)
+        self.assertEqual(failed, ["Timed out after 0.3 seconds"] * 2)
+
+    def test_idle_timeout(self):
+        failed = self.run_watched_case("echo 1..2; echo ok; sleep 5 & "
+                                       "sleep 5", idle_timeout=0.3)
+        self.assertEqual(failed, ["No output for 0.3 seconds"] * 2)
+
+    def test_parser_failure(self):
+        # Killed with the process group when watched, and reaped
+        self.parser = lambda stream: FailingParser(Parser()(stream))
+        for (script, timeouts) in [("sleep 5 & sleep 5", {'timeout': 10}),
+                                   ("exec sleep 5", {})]:
+            failed = self.run_watched_case("echo 1..2; echo ok; " + script,
+                                           **timeouts)
+            self.assertEqual(failed, ["Parser failed"] * 2)
+            self.assertEqual(case.running_groups, set())
+
+    def test_spawn_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = os.path.join(directory, 'case.sh')
+            with open(script, 'w') as f:
+                f.write("#!/nonexistent/interpreter\n")
+            os.chmod(script, 0o755)
+            case = Case(script, None, 1)
+
+            async def run_async():
+                return [result async for result
+                        in case.run_async(self.parser, "local")]
+
+            for results in [list(case(self.parser, "local")),
+                            asyncio.run(run_async())]:
+                self.assertEqual(len(results), 2)
+                self.assertIn("No such file", results[-1].failed)
+
+    def test_executor_failure(self):
+        # A test raising while run still ends with a result
+        for executor_class in [Executor, AsyncExecutor]:
+            case = Case("/bin/true", None, 1)
+            case.environment = {'BROKEN': 1}
+            results = queue.Queue()
+            executor = executor_class("local", results)
+            executor.start()
+            executor.queue(case)
+
+            result = results.get(timeout=10)
+            while isinstance(result, list):
+                result = results.get(timeout=10)
+            self.assertIs(result.test, case)
+            self.assertTrue(result.failed)
+
+            executor.terminate()
+            executor.join()
+
+    def test_interrupted(self):
+        # Watched cases run in a session of their own, Ctrl-C does not
+        # reach them, so they are killed when mistest exits
+        script = (
+            "from mistest.case import Case, running_groups\n"
+            "from mistest.engine import AsyncExecutor\n"
+            "from mistest.executor import Executor\n"
+            "import queue, sys, time\n"
+            "executor = %s('local', queue.Queue())\n"
+            "executor.start()\n"
+            "executor.queue(Case('/bin/sh', None, 1, timeout=60, arguments=["
+            "'-c', 'echo $$ >&2; exec sleep 30']))\n"
+            "while not running_groups:\n"
+            "    time.sleep(0.01)\n"
+            "sys.stdin.readline()\n"
+            "raise KeyboardInterrupt\n")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+
+        for executor_class in ['Executor', 'AsyncExecutor']:
+            process = subprocess.Popen(
+                [sys.executable, '-c', script % executor_class], cwd=root,
+                stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+            pid = int(process.stderr.readline())
+            process.stdin.close()
+            process.wait()
+            process.stderr.close()
+
+            # The case may linger as a zombie of init, but not run
+            for i in range(100):
+                try:
+                    with open('/proc/%d/stat' % pid) as f:
+                        state = f.read().rsplit(')', 1)[1].split()[0]
+                except FileNotFoundError:
+                    break
+                if state == 'Z':
+                    break
+                time.sleep(0.05)
+            else:
+                self.fail("Case left running")
+
+    def test_agent(self):
+        tap_str = "1..3\nok 1\n# diagnostic\nnot ok 2\nok 3 # SKIP\n"
+        case = Case("/bin/echo", None, 1, arguments=['-en', tap_str])
+        expected = [str(tap) for tap in case(self.parser, "local")][1:]
+
+        remote.token = b'secret'
+        self.addCleanup(setattr, remote, 'token', None)
+        with tempfile.TemporaryDirectory() as directory:
+            agents = [Agent(('127.0.0.1', 0), b'secret'),
+                      Agent(os.path.join(directory, 'agent.socket'))]
+
+            for agent in agents:
+                agent.start()
+                if isinstance(agent.address, str):
+                    resource = "agent://" + agent.address
+                else:
+                    resource = "agent://%s:%d" % agent.address
+
+                # Resources naming the same agent share a connection
+                for name in [resource + "#1", resource + "#2"]:
+                    results = [str(tap) for tap in case(self.parser, name)]
+                    self.assertEqual(results[1:], expected)
+
+                self.assertIs(AgentConnection.get(resource + "#1"),
+                              AgentConnection.get(resource + "#2"))
+
+                watched = Case("/bin/sh", None, 1, timeout=0.3,
+                               arguments=['-c', 'echo 1..1; sleep 5'])
+                result = list(watched(self.parser, resource))[-1]
+                self.assertEqual(result.failed, "Timed out after 0.3 seconds")
+
+                missing = Case("/bin/sh", None, 1)
+                missing.file = "/nonexistent"
+                result = list(missing(self.parser, resource))[-1]
+                self.assertIn("No such file", result.failed)
+
+                agent.stop()
+
+            # Connections without the token are closed
+            agent = Agent(('127.0.0.1', 0), b'other')
+            agent.start()
+            result = list(case(self.parser, "agent://%s:%d" %
+                               agent.address))[-1]
+            self.assertEqual(result.failed, "Connection to agent %s lost" %
+                             str(agent.address))
+            agent.stop()
+
+    def test_remote_stream(self):
+        # A full stream holds back the agent until the case is read
+        stream = RemoteStream()
+        stream.max_buffered = 4
+        fed = threading.Event()
+
+        def feed():
+            for data in [b'abc', b'def', b'ghi']:
+                stream.feed(data)
+            fed.set()
+            stream.end()
+
+        thread = threading.Thread(target=feed)
+        thread.start()
+        self.assertFalse(fed.wait(0.1))
+        self.assertEqual(stream.buffered, 6)
+
+        buffer = bytearray(5)
+        data = b''
+        count = stream.readinto(buffer)
+        while count:
+            data += buffer[:count]
+            count = stream.readinto(buffer)
+        thread.join()
+        self.assertEqual(data, b'abcdefghi')
+
+    def test_result_cache(self):
+        passing = Case("/bin/echo", None, 1, arguments=['-en', "1..1\nok\n"])
+        failing = Case("/bin/echo", None, 1,
+                       arguments=['-en', "1..1\nnot ok\n"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+            Case.result_cache = cache
+            try:
+                for case in [passing, failing, passing, failing]:
+                    results = list(case(self.parser, "local"))
+            finally:
+                Case.result_cache = None
+
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        self.assertEqual(passing.execution_results[0],
+                         passing.execution_results[1])
+        self.assertEqual(results[-1].not_ok, 1)
+
+    def test_result_cache_failure(self):
+        # Failing to store a result does not fail the case
+        case = Case("/bin/echo", None, 1, arguments=['-en', "1..1\nok\n"])
+
+        async def run_async():
+            return [output async for output in
+                    case.run_async(self.parser, "local")]
+
+        with tempfile.TemporaryDirectory() as directory:
+            Case.result_cache = ResultCache(os.path.join(directory, 'gone'))
+            os.rmdir(Case.result_cache.directory)
+            try:
+                for outputs in [self.run_executor(case),
+                                asyncio.run(run_async())]:
+                    results = [output for output in outputs
+                               if isinstance(output, CaseExecutionResult)]
+                    self.assertEqual(len(results), 1)
+                    self.assertTrue(results[0].passed())
+            finally:
+                Case.result_cache = None
+
+    def run_executor(self, test):
+        """Run a test on an executor, returning everything it output"""
+        results = queue.Queue()
+        executor = Executor("local", results)
+        executor.start()
+        executor.queue(test)
+
+        outputs = []
+        while True:
+            message = results.get(timeout=10)
+            if isinstance(message, list):
+                outputs += message
+                continue
+
+            outputs.append(message)
+            if message.test is test:
+                break
+
+        executor.terminate()
+        executor.join()
+        return outputs
+
+    def test_result_cache_dependencies(self):
+        with tempfile.TemporaryDirectory() as directory:
+            allow = os.path.join(directory, 'allow')
+            marker = os.path.join(directory, 'marker')
+            setup = Case("/bin/sh", None, 1, arguments=[
+                '-c', "echo 1..1; test -e %s && touch %s && echo ok || "
+                "echo not ok" % (allow, marker)])
+            check = Case("/bin/sh", None, 2, dependencies=[setup], arguments=[
+                '-c', "echo 1..1; test -e %s && echo ok || "
+                "echo not ok 1 - marker missing" % marker])
+
+            Case.result_cache = ResultCache(os.path.join(directory, 'cache'))
+            try:
+                open(allow, 'w').close()
+                self.run_executor(check)
+
+                # Dependencies always run, replaying only the test
+                os.unlink(marker)
+                outputs = [str(output) for output in self.run_executor(check)]
+                self.assertTrue(os.path.exists(marker))
+                self.assertEqual(len([output for output in outputs
+                                      if output.startswith("# Cached")]), 1)
+
+                # A test is not replayed once a dependency failed
+                os.unlink(allow)
+                os.unlink(marker)
+                outputs = self.run_executor(check)
+                self.assertFalse([output for output in outputs
+                                  if str(output).startswith("# Cached")])
+                self.assertEqual(outputs[-1].not_ok, 1)
+            finally:
+                Case.result_cache = None
+
+    def test_case_result(self):
+        case = Case("/bin/true", None, 1)
+        for lines in [[TestLine(True, 1), TestLine(False, 2, directive="TODO"),
+                       TestLine(True, 3)],
+                      [TestLine(True, 1), TestLine(True, 2, directive="TODO")]]:
+            result = CaseExecutionResult(case)
+            result.append(Plan(3))
+            for line in lines:
+                result.append(line)
+            case.execution_results.append(result)
+
+        self.assertEqual(case.execution_results[1][2].directive, "TODO")
+        self.assertIsNone(case.execution_results[1][3])
+
+        # A line missing from a run makes the aggregate not ok
+        result = case.generate_result()
+        self.assertEqual([str(aggregate) for aggregate in result],
+                         ["ok 1", "not ok 2 # TODO", "not ok 3"])
+        self.assertEqual(str(result[3]), "not ok 3")
+
+    def test_line_index(self):
+        # Lines out of sequence, repeated and between diagnostics
+        numbers = [1, 2, 5, 3, 4, 5, 6, 2, 9, 7, 8, 10, 0]
+        result = CaseExecutionResult(None)
+        result.append(Plan(11))
+        expected = {}
+        for (i, number) in enumerate(numbers):
+            line = TestLine(number % 3 != 0, number, description=str(i))
+            result.append(line)
+            expected.setdefault(number, line)
+            if number % 2 == 0:
+                result.append(Diagnostic("after " + str(i)))
+
+        for number in range(1, 12):
+            self.assertIs(result[number], expected.get(number))
+
+        # Only the offsets after diagnostics and the lines out of
+        # sequence are kept
+        self.assertEqual(result.numbered, 10)
+        self.assertEqual(sorted(result.other_positions), [5, 9])
+        self.assertEqual(len(result.offsets), 4)
+        self.assertEqual(bytes(result.line_outcomes),
+                         bytes([1, 1, 0, 1, 1, 0, 1, 1, 0, 1]))
+
+    def test_pending_dependencies(self):
+        # Equal dependencies created separately are only run once
+        install = Case("/bin/true", None, 1)
+        configure = Case("/bin/echo", None, 2, arguments=['ok'])
+        first = Case("/bin/echo", None, 3, dependencies=[install, configure])
+        second = Case("/bin/echo", None, 4,
+                      dependencies=[Case("/bin/true", None, 1)])
+
+        self.assertEqual(install.dependency_key(),
+                         second.dependencies[0].dependency_key())
+        self.assertNotEqual(first.dependency_key(), second.dependency_key())
+
+        completed = set()
+        self.assertEqual(list(pending_dependencies(first, completed)),
+                         [install, configure])
+        self.assertEqual(list(pending_dependencies(second, completed)), [])
+
+    def test_dependency_keys(self):
+        install = Case("/bin/true", None, 1)
+        configure = Case("/bin/echo", None, 2, arguments=['ok'])
+        top = Suite("top")
+        case = Case("/bin/echo", top, 1, dependencies=[install])
+        top.append_test(case)
+
+        # The keys are computed as the graph is built, and then looked up
+        graph = DependencyGraph(top)
+        key = case.dependency_key()
+        install_key = install.dependency_key()
+        self.assertEqual(case.dependency_keys(), (install_key,))
+        self.assertIs(case.dependency_key(), key)
+        with unittest.mock.patch.object(Case, 'dependency_key',
+                                        side_effect=AssertionError):
+            self.assertEqual(list(pending_dependencies(case, set())),
+                             [install])
+            self.assertTrue(dependencies_passed(case, set()))
+            self.assertEqual(graph.requirements(case), {install_key})
+
+        # Until another dependency is added
+        case.append_dep(configure)
+        self.assertEqual(len(case.dependency_keys()), 2)
+        self.assertNotEqual(case.dependency_key(), key)
+
+# Self test by forking off a child which will print the test output.
+if __name__ == '__main__':
+
+    unittest.main()
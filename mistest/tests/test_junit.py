@@ -0,0 +1,125 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+from xml.etree.ElementTree import Element, parse, tostring
+from ..tap import Parser
+from ..case import Case
+from ..suite import Suite
+from ..output import Output
+from ..junit import JUnitWriter, escape_attribute
+from ..scheduler import Scheduler
+
+
+class TestJUnitWriter(unittest.TestCase):
+
+    def suite(self):
+        top = Suite("Top level suite")
+        suite = Suite("suite.yaml", top, 1)
+        sub_suite = Suite("sub_suite.yaml", suite, 3)
+        top.append_test(suite)
+
+        outputs = ["1..2\nok 1 - first <&>\nnot ok 2 - \"second\"\n",
+                   "1..2\nok 1 # SKIP café\nnot ok 2 # TODO later\n",
+                   "not tap\n",
+                   "1..0\n"]
+        for (i, output) in enumerate(outputs):
+            parent = sub_suite if i == 3 else suite
+            parent.append_test(Case("/bin/echo", parent, i + 1,
+                                    arguments=['-en', output]))
+        suite.append_test(sub_suite)
+
+        return top
+
+    def test_same_as_tree(self):
+        top = self.suite()
+        cases = [test for test in top.test_list[0].test_list
+                 if isinstance(test, Case)]
+        cases += top.test_list[0].test_list[-1].test_list
+
+        parser = Parser()
+        for case in cases:
+            for result in case(parser, "local"):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            tree = os.path.join(directory, 'tree.xml')
+            stream = os.path.join(directory, 'stream.xml')
+
+            output = Output()
+            output.set_junit_xml(tree)
+            output.output_junit_xml(top.generate_result())
+
+            # Cases finish in any order, but are written in suite order
+            writer = JUnitWriter(stream, top)
+            random.Random(1).shuffle(cases)
+            for case in cases[:-1]:
+                writer.finished(case)
+            writer.file.flush()
+            with open(stream, 'rb') as f:
+                self.assertTrue(f.read().startswith(b'<testsuites>'))
+            writer.finished(cases[-1])
+            writer.close()
+
+            with open(tree, 'rb') as f:
+                expected = f.read()
+            with open(stream, 'rb') as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_escape_attribute(self):
+        # Names are escaped as ElementTree escapes them
+        for name in ["ok 1", "<&>\"'", "tab\there\r\n", "café ☃"]:
+            element = tostring(Element('testcase', {'name': name}),
+                               encoding='us-ascii')
+            self.assertEqual(element, b'<testcase name="' +
+                             escape_attribute(name) + b'" />')
+
+    def test_repeat_inconsistent_plans(self):
+        # Every other run bails out before its plan
+        with tempfile.TemporaryDirectory() as directory:
+            flag = os.path.join(directory, 'flag')
+            top = Suite("Top level suite")
+            suite = Suite("suite.yaml", top, 1)
+            top.append_test(suite)
+            suite.append_test(Case("/bin/sh", suite, 1, repeat=4, arguments=[
+                '-c', "if [ -e %s ]; then rm %s; echo 1..2; echo ok; "
+                "echo ok; else touch %s; echo 'Bail out!'; fi" %
+                (flag, flag, flag)]))
+
+            junit_xml = os.path.join(directory, 'junit.xml')
+            output = Output()
+            output.set_junit_xml(junit_xml)
+            with contextlib.redirect_stdout(io.StringIO()):
+                output.start(top)
+                Scheduler(["first"], top, output)()
+                output.postprocess(top.generate_result())
+
+            testcases = parse(junit_xml).getroot().iter('testcase')
+            self.assertEqual([(testcase.get('name'),
+                               testcase.find('failure') is not None)
+                              for testcase in testcases],
+                             [("not ok 1", True), ("not ok 2", True)])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
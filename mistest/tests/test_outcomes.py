@@ -0,0 +1,68 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+import unittest
+from ..tap import TestLine, Plan
+from ..case import CaseExecutionResult
+from ..outcomes import CountedOutcomes, ArrayOutcomes, load_numpy
+
+
+def repeated_runs(runs, planned):
+    """Create execution results of random outcomes, some cut short"""
+    generator = random.Random(runs)
+    results = []
+    for run in range(runs):
+        result = CaseExecutionResult(None)
+        result.append(Plan(planned))
+        for number in range(1, generator.randint(planned - 2, planned) + 1):
+            directive = generator.choice([None, None, "TODO", "SKIP"])
+            result.append(TestLine(generator.random() < 0.8, number,
+                                   directive=directive))
+        results.append(result)
+
+    return results
+
+
+class TestOutcomes(unittest.TestCase):
+
+    def test_counted(self):
+        results = []
+        for lines in [[TestLine(True, 1), TestLine(False, 2)],
+                      [TestLine(True, 1), TestLine(True, 2)],
+                      [TestLine(True, 1, directive="SKIP")]]:
+            result = CaseExecutionResult(None)
+            result.append(Plan(2))
+            for line in lines:
+                result.append(line)
+            results.append(result)
+
+        outcomes = CountedOutcomes(2, results)
+        self.assertEqual(outcomes.aggregates(), [(True, None), (False, None)])
+        self.assertEqual(outcomes.pass_rates(), [1.0, 1 / 3])
+        self.assertEqual(outcomes.flakiness(), [0.0, 1.0])
+
+    @unittest.skipUnless(load_numpy(), "NumPy is not installed")
+    def test_arrays_same_as_counted(self):
+        for runs in [1, 2, 50]:
+            results = repeated_runs(runs, 20)
+            counted = CountedOutcomes(20, results)
+            arrays = ArrayOutcomes(20, results)
+
+            self.assertEqual(counted.aggregates(), arrays.aggregates())
+            self.assertEqual(counted.pass_rates(), arrays.pass_rates())
+            self.assertEqual(counted.flakiness(), arrays.flakiness())
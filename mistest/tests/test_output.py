@@ -0,0 +1,89 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from xml.etree.ElementTree import parse
+from ..output import OutputWriter
+
+# The package directory holding mistest
+root = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+class TestOutputWriter(unittest.TestCase):
+
+    def test_order(self):
+        stream = io.StringIO()
+        writer = OutputWriter(stream)
+        writer.buffer_size = 100
+        writer.start()
+
+        lines = ["line " + str(i) + "\n" for i in range(1000)]
+        for line in lines:
+            writer.write(line)
+        writer.close()
+
+        self.assertEqual(stream.getvalue(), "".join(lines))
+
+    def test_interval(self):
+        stream = io.StringIO()
+        writer = OutputWriter(stream)
+        writer.start()
+
+        # Text short of a batch is written after the flush interval
+        writer.write("pending\n")
+        deadline = time.monotonic() + 10
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(writer.flush_interval)
+
+        self.assertEqual(stream.getvalue(), "pending\n")
+        writer.close()
+
+
+class TestOutput(unittest.TestCase):
+
+    def test_interrupted(self):
+        # A run interrupted by Ctrl-C writes out what was output so far
+        with tempfile.TemporaryDirectory() as directory:
+            cases = []
+            for (name, script) in [('first.sh', "echo 1..1; echo ok"),
+                                   ('second.sh', "echo 1..2; echo ok; "
+                                    "kill -INT $PPID; exec sleep 30")]:
+                cases.append(os.path.join(directory, name))
+                with open(cases[-1], 'w') as f:
+                    f.write("#!/bin/sh\n" + script + "\n")
+                os.chmod(cases[-1], 0o755)
+
+            junit_xml = os.path.join(directory, 'junit.xml')
+            process = subprocess.run(
+                [sys.executable, 'mistest.py', '--immediate-output',
+                 '--timeout', '60', '--junit-xml', junit_xml] + cases,
+                cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                timeout=20)
+
+            self.assertNotEqual(process.returncode, 0)
+            self.assertIn(b"ok 1\n", process.stdout)
+
+            suites = parse(junit_xml).getroot().findall('testsuite')
+            self.assertEqual(len(suites), 1)
+            self.assertEqual([len(suite) for suite in suites[0]], [1, 0])
@@ -0,0 +1,117 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from .. import parse_separated
+from .. import plan
+from ..plan import PlanCache
+
+
+class TestPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        directory = self.directory.name
+
+        self.case = os.path.join(directory, 'case.sh')
+        with open(self.case, 'w') as f:
+            f.write("#!/bin/sh\necho 1..1\necho ok\n")
+        os.chmod(self.case, 0o755)
+
+        self.sub_suite = os.path.join(directory, 'sub_suite.yaml')
+        with open(self.sub_suite, 'w') as f:
+            f.write("Tests:\n  - case.sh:\n      arguments: -n sub\n")
+
+        self.suite = os.path.join(directory, 'suite.yaml')
+        with open(self.suite, 'w') as f:
+            f.write("Ordering: any\nDependencies:\n  - case.sh\nTests:\n"
+                    "  - case.sh\n  - sub_suite.yaml\n")
+
+        self.arguments = ['first', 'second', '-', self.suite]
+        self.cache = PlanCache(os.path.join(directory, 'plan'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def save(self):
+        (resources, suite) = parse_separated(self.arguments)
+        self.cache.save(self.arguments, resources, suite)
+        return suite
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.load(self.arguments))
+        suite = self.save()
+
+        (resources, loaded) = self.cache.load(self.arguments)
+        self.assertEqual(resources, ['first', 'second'])
+        self.assertEqual(loaded, suite)
+        self.assertEqual(loaded.test_list[0].ordering, 'any')
+
+        # The JUnit names are part of the plan
+        case = loaded.test_list[0].test_list[0]
+        self.assertEqual(case.cached_junit_name,
+                         suite.test_list[0].test_list[0].junit_name())
+
+        # Another command line has a plan of its own
+        self.assertIsNone(self.cache.load(['first', '-', self.suite]))
+
+    def test_invalidation(self):
+        def touch(file):
+            stat = os.stat(file)
+            os.utime(file, ns=(stat.st_atime_ns,
+                               stat.st_mtime_ns + 1000000000))
+
+        def append(file):
+            with open(file, 'a') as f:
+                f.write("\n")
+
+        def chmod(file):
+            os.chmod(file, 0o700)
+
+        for change in [touch, append, chmod]:
+            for file in [self.sub_suite, self.case]:
+                self.save()
+                self.assertIsNotNone(self.cache.load(self.arguments))
+                change(file)
+                self.assertIsNone(self.cache.load(self.arguments))
+
+        # So is a plan of a missing file
+        self.save()
+        os.unlink(self.sub_suite)
+        self.assertIsNone(self.cache.load(self.arguments))
+
+    def test_version(self):
+        self.save()
+        version = plan.plan_version
+        plan.plan_version = version + 1
+        try:
+            self.assertIsNone(self.cache.load(self.arguments))
+        finally:
+            plan.plan_version = version
+
+        self.assertIsNotNone(self.cache.load(self.arguments))
+
+        # A corrupt plan is not loaded either
+        with open(self.cache.file, 'wb') as f:
+            f.write(b'not a plan')
+        self.assertIsNone(self.cache.load(self.arguments))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
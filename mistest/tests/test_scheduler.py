@@ -0,0 +1,261 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import queue
+import tempfile
+import time
+import unittest
+from ..tap import TestLine
+from ..case import Case, CaseExecutionResult
+from ..executor import ResultBatcher
+from ..metrics import RunMetrics
+from ..suite import Suite
+from ..history import DurationHistory
+from ..scheduler import (Scheduler, LongestFirstScheduler,
+                         WorkStealingScheduler, percentile)
+
+
+class RecordingOutput:
+    """An output recording the results and finished tests"""
+
+    def __init__(self):
+        self.results = []
+        self.finished_tests = []
+
+    def __call__(self, result):
+        if isinstance(result, CaseExecutionResult):
+            self.results.append(result)
+
+    def finished(self, test):
+        self.finished_tests.append(test)
+
+    def summarize(self, line):
+        pass
+
+
+class TestRepetitions(unittest.TestCase):
+
+    def run_suite(self, scheduler_class, max_failures=None):
+        suite = Suite("top")
+        suite.repeat = 2
+        passing = Case("/bin/echo", suite, 1, arguments=['-en', "1..1\nok\n"],
+                       repeat=3)
+        failing = Case("/bin/echo", suite, 2,
+                       arguments=['-en', "1..1\nnot ok\n"], repeat=3)
+        suite.append_test(passing)
+        suite.append_test(failing)
+
+        output = RecordingOutput()
+        scheduler_class.max_failures = max_failures
+        try:
+            scheduler_class(["first", "second"], suite, output)()
+        finally:
+            scheduler_class.max_failures = None
+
+        self.assertEqual(output.finished_tests, [passing, failing])
+        return (passing, failing)
+
+    def test_repeat(self):
+        for scheduler_class in [Scheduler, WorkStealingScheduler]:
+            (passing, failing) = self.run_suite(scheduler_class)
+            self.assertEqual(len(passing.execution_results), 6)
+            self.assertEqual(len(failing.execution_results), 6)
+            self.assertEqual(passing.generate_result().pass_rates(), [1.0])
+            self.assertEqual(failing.generate_result().pass_rates(), [0.0])
+
+    def test_max_failures(self):
+        (passing, failing) = self.run_suite(Scheduler, max_failures=2)
+        self.assertEqual(len(passing.execution_results), 6)
+
+        # Repetitions running when the limit is reached still complete
+        self.assertIn(len(failing.execution_results), [2, 3])
+
+    def test_metrics(self):
+        suite = Suite("top")
+        suite.append_test(Case("/bin/echo", suite, 1,
+                               arguments=['-en', "1..2\nok\nnot ok\n"],
+                               repeat=3))
+
+        scheduler = Scheduler(["first", "second"], suite, RecordingOutput())
+        scheduler.metrics = RunMetrics(scheduler)
+        self.assertEqual(scheduler.metrics.snapshot()['tests'],
+                         {'completed': 0, 'remaining': 3})
+        scheduler()
+
+        snapshot = scheduler.metrics.snapshot()
+        self.assertEqual(snapshot['tests'], {'completed': 3, 'remaining': 0})
+        self.assertEqual(snapshot['cases'], {'passed': 0, 'failed': 3})
+        self.assertEqual(snapshot['lines'], 3 * 4)
+        self.assertEqual(snapshot['resources']['first']['state'], 'idle')
+
+        # A test published before its start was recorded is still busy
+        scheduler.metrics.scheduled_at.clear()
+        scheduler.scheduled_tests['first'] = suite.test_list[0]
+        snapshot = scheduler.metrics.snapshot()
+        self.assertEqual(snapshot['resources']['first']['state'], 'busy')
+        self.assertNotIn('running', snapshot['resources']['first'])
+
+    def test_metrics_rate(self):
+        suite = Suite("top")
+        scheduler = Scheduler(["first"], suite, RecordingOutput())
+        metrics = RunMetrics(scheduler)
+
+        # Lines within the window count, older samples do not
+        now = time.monotonic()
+        metrics.samples.clear()
+        metrics.samples.extend([(now - 30, 0), (now - 5, 100)])
+        metrics.lines = 150
+
+        # Snapshots do not change the rate seen by other consumers
+        for i in range(3):
+            rate = metrics.snapshot()['lines_per_second']
+            self.assertGreater(rate, 9)
+            self.assertLessEqual(rate, 10)
+
+        # A new sample is taken once the sample interval has passed
+        metrics.record_lines(10)
+        self.assertEqual(metrics.samples[-1][1], 160)
+        self.assertEqual(len(metrics.samples), 3)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([3, 1, 2, 4], 0.5), 2)
+        self.assertEqual(percentile([3, 1, 2, 4], 0.9), 4)
+        self.assertEqual(percentile([5], 0.5), 5)
+
+
+class TestLongestFirst(unittest.TestCase):
+
+    def test_history(self):
+        (first, second, third) = [Case("/bin/echo", None, 1, arguments=[name])
+                                  for name in ['first', 'second', 'third']]
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'history.json')
+            history = DurationHistory(file)
+            self.assertEqual(history.estimate(first),
+                             DurationHistory.default_estimate)
+
+            # The latest run is weighted into the mean
+            history.record(first, 1.0)
+            history.record(first, 2.0)
+            self.assertAlmostEqual(history.estimate(first), 1.3)
+
+            # Unknown cases are estimated at the median of known ones
+            history.record(second, 5.0)
+            history.record(Case("/bin/echo", None, 1, arguments=['x']), 9.0)
+            self.assertEqual(history.estimate(third), 5.0)
+
+            history.save()
+            loaded = DurationHistory(file)
+            self.assertAlmostEqual(loaded.estimate(first), 1.3)
+            self.assertEqual(loaded.estimate(third), 5.0)
+
+    def test_order(self):
+        top = Suite("top")
+        any_suite = Suite("any.yaml", top, 1)
+        any_suite.set_ordering('any')
+        sequential = Suite("sequential.yaml", top, 2)
+        top.append_test(any_suite)
+        top.append_test(sequential)
+
+        cases = {}
+        for (suite, names) in [(any_suite, ['short', 'long', 'medium']),
+                               (sequential, ['first', 'second'])]:
+            for name in names:
+                case = Case("/bin/echo", suite, 1, arguments=[name])
+                suite.append_test(case)
+                cases[name] = case
+
+        with tempfile.TemporaryDirectory() as directory:
+            history = DurationHistory(os.path.join(directory, 'history'))
+            for (name, duration) in [('short', 1.0), ('long', 3.0),
+                                     ('medium', 2.0), ('first', 1.0),
+                                     ('second', 1.0)]:
+                history.record(cases[name], duration)
+
+            scheduler = LongestFirstScheduler(["first", "second"], top,
+                                              RecordingOutput(),
+                                              history=history)
+            try:
+                # Sequential suites keep their place, run as one test
+                tests = scheduler.order(list(top))
+                self.assertEqual(tests, [cases['long'],
+                                         cases['medium'],
+                                         cases['short'], sequential])
+                self.assertEqual(scheduler.expected_duration(sequential), 2.0)
+
+                # long and medium start, short follows medium and the
+                # sequential suite follows long
+                self.assertEqual(scheduler.predict_makespan(tests), 5.0)
+
+                # Dependencies are run once per resource
+                setup = Case("/bin/echo", None, 1, arguments=['setup'])
+                history.record(setup, 0.5)
+                short = Case("/bin/echo", None, 1, arguments=['short'],
+                             dependencies=[setup])
+                scheduler.resources = ["first"]
+                self.assertEqual(scheduler.predict_makespan([short, short]),
+                                 2.5)
+            finally:
+                scheduler.terminate()
+
+
+class TestResultBatcher(unittest.TestCase):
+
+    def test_batches(self):
+        result_queue = queue.Queue()
+        batcher = ResultBatcher(result_queue)
+        batcher.latency = 60
+
+        lines = [TestLine(True, number) for number in range(1, 301)]
+        for line in lines:
+            batcher.put(line)
+
+        # Only full batches are sent before the deadline
+        self.assertEqual(result_queue.qsize(), 1)
+
+        # A result sends the rest first and is sent on its own
+        result = CaseExecutionResult(None)
+        batcher.put(result)
+        self.assertEqual(result_queue.get(), lines[:256])
+        self.assertEqual(result_queue.get(), lines[256:])
+        self.assertIs(result_queue.get(), result)
+
+    def test_scheduler_flush(self):
+        # Lines held back by a quiet executor are collected even while
+        # the queue is kept busy by the others
+        case = Case("/bin/true", None, 1)
+        suite = Suite("top")
+        suite.append_test(case)
+        scheduler = Scheduler(["first", "second"], suite, RecordingOutput())
+        try:
+            list(scheduler.repetitions([case]))
+            scheduler.repetitions.started(case)
+            scheduler.scheduled_tests["first"] = case
+            scheduler.executors["second"].results.latency = 60
+            line = TestLine(True, 1)
+            scheduler.executors["second"].queue_result(line)
+
+            result = CaseExecutionResult(case)
+            result.executor = scheduler.executors["first"]
+            scheduler.result_queue.put([])
+            scheduler.result_queue.put(result)
+            self.assertEqual(scheduler.wait_for_free_resource(), "first")
+            self.assertEqual(scheduler.result_queue.get_nowait(), [line])
+        finally:
+            scheduler.terminate()
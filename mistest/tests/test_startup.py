@@ -0,0 +1,96 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# The package directory holding mistest
+root = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# The time a cold start may take on top of starting the interpreter,
+# in seconds, generous enough for slow build machines
+budget = float(os.environ.get('MISTEST_STARTUP_BUDGET', '0.5'))
+
+
+def run_python(arguments):
+    """Run python in a fresh process, returning the wall clock time"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + arguments, cwd=root, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+class TestStartup(unittest.TestCase):
+
+    def cold_start(self, arguments):
+        """The best of a few cold starts, less the interpreter start"""
+        interpreter = min(run_python(['-c', 'pass']) for i in range(3))
+        return min(run_python(arguments) for i in range(3)) - interpreter
+
+    def test_lazy_imports(self):
+        # Importing the package must not pull in the heavy modules
+        heavy = ['asyncio', 'concurrent.futures', 'multiprocessing', 'ply',
+                 'unittest', 'xml.etree.ElementTree', 'yaml']
+        output = subprocess.check_output(
+            [sys.executable, '-c', 'import sys, mistest; '
+             'print(" ".join(sorted(sys.modules)))'], cwd=root)
+        self.assertEqual([module for module in heavy
+                          if module in output.decode().split()], [])
+
+    def test_help_budget(self):
+        elapsed = self.cold_start(['mistest.py', '--help'])
+        self.assertLess(elapsed, budget)
+
+    def test_one_case_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            case = os.path.join(directory, 'case.sh')
+            with open(case, 'w') as f:
+                f.write("#!/bin/sh\necho 1..1\necho ok\n")
+            os.chmod(case, 0o755)
+
+            elapsed = self.cold_start(['mistest.py', case])
+            self.assertLess(elapsed, budget)
+
+    def test_profile_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            case = os.path.join(directory, 'case.sh')
+            with open(case, 'w') as f:
+                f.write("#!/bin/sh\necho 1..1\necho ok\n")
+            os.chmod(case, 0o755)
+            profile = os.path.join(directory, 'profile.json')
+
+            run_python(['mistest.py', '--profile-json', profile, case])
+            with open(profile) as f:
+                data = json.load(f)
+
+        self.assertEqual([phase['phase'] for phase in data['phases']][-2:],
+                         ['run', 'report'])
+        self.assertIn('case spawn', data['run'])
+        self.assertIn('tap parsing', data['run'])
+        self.assertEqual(data['cases'][0]['case'], case)
+        self.assertEqual(data['resources']['local']['cases'], 1)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
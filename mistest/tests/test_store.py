@@ -0,0 +1,57 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from ..store import TapSegment
+from ..tap import TestLine
+
+
+class TestTapSegment(unittest.TestCase):
+
+    def setUp(self):
+        self.segment = TapSegment(10)
+        self.stores = [self.segment.store() for i in range(5)]
+
+    def tearDown(self):
+        self.segment.close()
+
+    def held(self):
+        """The number of records held in memory by all stores"""
+        return (sum(len(store.buffer) for store in self.stores) +
+                len(self.segment.cached_records))
+
+    def test_resident_limit(self):
+        for number in range(1, 31):
+            for store in self.stores:
+                store.append(TestLine(True, number))
+                self.assertLessEqual(self.held(), 10)
+
+        for store in self.stores:
+            self.assertEqual([tap.number for tap in store],
+                             list(range(1, 31)))
+            self.assertLessEqual(self.held(), 10)
+
+        # Indexing caches a single chunk, for all stores
+        for position in [0, 29, 3, 15]:
+            for store in self.stores:
+                self.assertEqual(store[position].number, position + 1)
+                self.assertEqual(self.segment.resident, self.held())
+                self.assertLessEqual(self.held(), 10)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
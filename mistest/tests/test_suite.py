@@ -0,0 +1,115 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import yaml
+from .. import suite
+
+# The package directory holding mistest
+root = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def names(test):
+    """The names of a tree of tests, in order"""
+    if hasattr(test, 'test_list'):
+        return [test.name, [names(suite_test)
+                            for suite_test in test.test_list]]
+
+    return [test.file] + test.arguments
+
+
+class TestSuiteLoading(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        directory = self.directory.name
+
+        with open(os.path.join(directory, 'case.sh'), 'w') as f:
+            f.write("#!/bin/sh\necho 1..1\necho ok\n")
+        os.chmod(os.path.join(directory, 'case.sh'), 0o755)
+
+        # A top level suite with many sibling suites, each with their own
+        self.top = os.path.join(directory, 'top.yaml')
+        with open(self.top, 'w') as f:
+            f.write("Ordering: any\nDependencies:\n  - case.sh\nTests:\n")
+            for i in range(8):
+                f.write("  - case.sh:\n      arguments: -n %d\n" % i)
+                f.write("  - sibling_%d.yaml\n" % i)
+
+        for i in range(8):
+            with open(os.path.join(directory, 'sibling_%d.yaml' % i),
+                      'w') as f:
+                f.write("Tests:\n  - case.sh:\n      arguments: -s %d\n"
+                        "  - child_%d.yaml\n" % (i, i))
+            with open(os.path.join(directory, 'child_%d.yaml' % i),
+                      'w') as f:
+                f.write("Tests:\n  - case.sh\n")
+
+    def tearDown(self):
+        suite.close_load_pool()
+        suite.load_workers = 1
+        suite.yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        self.directory.cleanup()
+
+    def parse(self, workers, loader=None):
+        suite.load_workers = workers
+        if loader:
+            suite.yaml_loader = loader
+        return suite.parse_yaml_suite(self.top, None, 1)
+
+    def test_python_loader(self):
+        # Without libyaml the pure python loader is used
+        output = subprocess.check_output(
+            [sys.executable, '-c', 'import yaml; del yaml.CSafeLoader; '
+             'from mistest import suite; '
+             'print(suite.yaml_loader is yaml.SafeLoader)'], cwd=root)
+        self.assertEqual(output.decode().strip(), "True")
+
+        # And parses the same tree
+        expected = self.parse(1)
+        parsed = self.parse(1, yaml.SafeLoader)
+        self.assertEqual(parsed, expected)
+        self.assertEqual(names(parsed), names(expected))
+
+    def test_load_workers(self):
+        expected = self.parse(1)
+        parsed = self.parse(4)
+        self.assertEqual(parsed, expected)
+        self.assertEqual(names(parsed), names(expected))
+
+    def test_load_workers_error(self):
+        with open(os.path.join(self.directory.name, 'sibling_5.yaml'),
+                  'w') as f:
+            f.write("Tests: [case.sh\n")
+
+        errors = []
+        for workers in [1, 4]:
+            with self.assertRaises(yaml.YAMLError) as context:
+                self.parse(workers)
+            errors.append(str(context.exception))
+
+        self.assertEqual(errors[0], errors[1])
+        self.assertIn("sibling_5.yaml", errors[0])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
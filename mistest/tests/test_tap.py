@@ -0,0 +1,179 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from ..tap import (Parser, LineReader, NumberingError, BailOutError,
+                   NotTapError, PlanError, pack)
+
+# The directory of the mistest package
+package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestParser(unittest.TestCase):
+
+    def run_parser(self, tap_str):
+        f = io.StringIO(tap_str)
+        p = Parser()
+        p(f)
+        last_tap = None
+        for tap in p:
+            last_tap = tap
+
+        return last_tap
+
+    def test_plan(self):
+        plan = self.run_parser("1..0 # all of them\n")
+        self.assertEqual(plan.number, 0)
+        self.assertEqual(plan.diagnostic, "all of them")
+
+    def test_2_ok(self):
+        ok2 = self.run_parser("1..2\n"
+                              "ok 1\n"
+                              "ok 2\n")
+        self.assertTrue(ok2.ok)
+        self.assertEqual(ok2.number, 2)
+        self.assertIsNone(ok2.description)
+        self.assertIsNone(ok2.directive)
+        self.assertIsNone(ok2.directive_description)
+
+    def test_3_nok(self):
+        not_ok3 = self.run_parser("1..3\n"
+                                  "ok 1 Hello\n"
+                                  "ok 2 drat\n"
+                                  "not ok Sometimes\n")
+        self.assertFalse(not_ok3.ok)
+        self.assertEqual(not_ok3.number, 3)
+        self.assertEqual(not_ok3.description, "Sometimes")
+        self.assertIsNone(not_ok3.directive)
+        self.assertIsNone(not_ok3.directive_description)
+
+    def test_todo(self):
+        ok_todo = self.run_parser("ok # ToDo the directive")
+
+        self.assertTrue(ok_todo.ok)
+        self.assertEqual(ok_todo.number, 1)
+        self.assertIsNone(ok_todo.description)
+        self.assertEqual(ok_todo.directive, "TODO")
+        self.assertEqual(ok_todo.directive_description, "the directive")
+
+    def test_skip(self):
+        not_ok_skip = self.run_parser("not ok # skip")
+
+        self.assertFalse(not_ok_skip.ok)
+        self.assertEqual(not_ok_skip.number, 1)
+        self.assertIsNone(not_ok_skip.description)
+        self.assertEqual(not_ok_skip.directive, "SKIP")
+        self.assertIsNone(not_ok_skip.directive_description)
+
+    def test_not_tap(self):
+        with self.assertRaises(NotTapError):
+            self.run_parser("a wtf")
+
+    def test_numbering_error(self):
+        with self.assertRaises(NumberingError):
+            self.run_parser("ok\n"
+                            "ok 3\n")
+
+    def test_plan_error(self):
+        with self.assertRaises(PlanError):
+            self.run_parser("1..1\n"
+                            "ok\n"
+                            "not ok\n")
+
+    def test_bail_out(self):
+        with self.assertRaises(BailOutError):
+            self.run_parser("Bail out!")
+
+    def test_empty_line(self):
+        with self.assertRaises(NotTapError):
+            self.run_parser("\n")
+
+    def test_shared_tables(self):
+        first = Parser()(io.StringIO("1..2\nok\nok\t2\n"))
+        second = Parser()(io.StringIO("ok\nnot ok\n"))
+        self.assertIs(first.parser.action, second.parser.action)
+
+        # Interleave the streams to check that the state is per parser
+        first_taps = iter(first)
+        second_taps = iter(second)
+        next(first_taps)
+        self.assertEqual(next(second_taps).number, 1)
+        self.assertEqual(next(first_taps).number, 1)
+        self.assertEqual(next(second_taps).number, 2)
+        self.assertEqual(next(first_taps).number, 2)
+
+    def test_line_reader(self):
+        stream = io.BytesIO("1..3\nok 1 - caf\u00e9\r\nok 2\n\nok 3".encode())
+        reader = LineReader(stream, block_size=4)
+        lines = [line for lines in reader for line in lines]
+        self.assertEqual(lines,
+                         ["1..3", "ok 1 - caf\u00e9\r", "ok 2", "", "ok 3"])
+
+    def test_fast_path_matches_grammar(self):
+        lines = ["1..4\n", "1..4 # all of them\n", "# a comment\n",
+                 "ok\n", "ok 1\n", "not ok 1 - Hello\n", "ok 1 Hello\n",
+                 "ok - dashed\n", "ok 1 - 2 things # TODO later\n",
+                 "not ok # skip\n", "ok 1 # SKIP   \n", "ok  1\n",
+                 "ok 1 - a # skipping\n", "ok 1 - ^\n", "1..2 3\n"]
+
+        for line in lines:
+            fast = Parser()(None)
+            grammar = Parser()(None)
+            try:
+                expected = grammar.parse_grammar(line)
+            except Exception as e:
+                with self.assertRaises(type(e)):
+                    fast.parse_line(line)
+                continue
+
+            tap = fast.parse_line(line)
+            self.assertEqual(type(expected), type(tap))
+            self.assertEqual(pack(expected), pack(tap))
+
+    def test_read_only_tables(self):
+        # Without tables the parser builds them, only writing them back
+        # where the package directory is writable
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree(package, os.path.join(directory, 'mistest'),
+                            ignore=shutil.ignore_patterns('parsetab.py',
+                                                          '__pycache__'))
+            script = ("import os, sys\n"
+                      "os.access = lambda path, mode: %s\n"
+                      "from mistest.tap import Parser\n"
+                      "parser = Parser()(sys.stdin)\n"
+                      "print(list(parser)[-1])\n")
+            tables = os.path.join(directory, 'mistest', 'parsetab.py')
+
+            for writable in [False, True]:
+                process = subprocess.run(
+                    [sys.executable, '-c', script % writable], cwd=directory,
+                    input=b"1..1\nok # skip\n", stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE, check=True)
+                self.assertEqual(process.stdout, b"ok 1 # SKIP\n")
+                self.assertEqual(process.stderr, b"")
+                self.assertEqual(os.path.isfile(tables), writable)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,175 @@
+#
+# Copyright 2014 Nils Carlson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import threading
+import time
+
+# The Profile of the run when profiling, timed by the instrumented code
+profile = None
+
+
+class PhaseTimer:
+    """Wall clock time spent in consecutive phases
+
+    Each phase ends when it is marked, and the next one starts. Once
+    memory is traced the tracemalloc peak of each phase is recorded too.
+
+    Parameters
+    ----------
+    start : The perf_counter time at which the first phase started.
+    """
+
+    def __init__(self, start=None):
+        self.last = start if start is not None else time.perf_counter()
+        self.phases = []
+        self.peaks = {}
+        self.tracemalloc = None
+
+    def trace_memory(self):
+        """Record the memory peaks of the following phases"""
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        tracemalloc.start()
+
+    def mark(self, phase):
+        """End the current phase, naming it"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+        if self.tracemalloc:
+            self.peaks[phase] = self.tracemalloc.get_traced_memory()[1]
+            self.tracemalloc.reset_peak()
+
+    def report(self, title):
+        """Get lines reporting the time of each phase and the total"""
+        lines = [title + ":"]
+        for (phase, elapsed) in self.phases:
+            lines.append("  %-24s %8.1f ms" % (phase, elapsed * 1000))
+        lines.append("  %-24s %8.1f ms" %
+                     ("total", sum(elapsed for (phase, elapsed)
+                                   in self.phases) * 1000))
+        return lines
+
+
+class Profile:
+    """Time spent within the run, per phase, resource and case
+
+    Phases overlap in time, as cases run concurrently on all resources,
+    so the time of each phase is summed over all resources and threads.
+    The time a case waits for output is the time of the case which was
+    neither spent spawning it nor parsing its output, it includes the
+    time the executor spent handing the output on. Memory peaks are only
+    kept for the phases of the PhaseTimer, the tracemalloc peak is
+    global and cannot be split between phases running concurrently.
+
+    Parameters
+    ----------
+    top : The number of slowest cases reported.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.lock = threading.Lock()
+        self.phases = collections.defaultdict(lambda: [0.0, 0])
+        self.resources = collections.defaultdict(
+            lambda: {'busy': 0.0, 'spawn': 0.0, 'parse': 0.0, 'cases': 0})
+        self.cases = collections.defaultdict(lambda: [0.0, 0])
+
+    def add(self, phase, seconds):
+        with self.lock:
+            entry = self.phases[phase]
+            entry[0] += seconds
+            entry[1] += 1
+
+    def record_case(self, case, resource, duration, spawn, parse):
+        """Record a run of a case, and the time spent spawning it and
+        parsing its output"""
+        with self.lock:
+            for (phase, seconds) in [('case spawn', spawn),
+                                     ('tap parsing', parse),
+                                     ('case output wait',
+                                      duration - spawn - parse)]:
+                entry = self.phases[phase]
+                entry[0] += seconds
+                entry[1] += 1
+
+            resource_entry = self.resources[resource]
+            resource_entry['busy'] += duration
+            resource_entry['spawn'] += spawn
+            resource_entry['parse'] += parse
+            resource_entry['cases'] += 1
+
+            case_entry = self.cases[case.name]
+            case_entry[0] += duration
+            case_entry[1] += 1
+
+    def data(self, timer):
+        """Get the profile, and the phases of a PhaseTimer, as a JSON
+        serializable dict"""
+        with self.lock:
+            slowest = sorted(self.cases.items(), key=lambda item: item[1][0],
+                             reverse=True)
+            return {
+                'phases': [{'phase': phase, 'seconds': seconds,
+                            'peak': timer.peaks.get(phase)}
+                           for (phase, seconds) in timer.phases],
+                'run': {phase: {'seconds': seconds, 'count': count}
+                        for (phase, (seconds, count)) in self.phases.items()},
+                'resources': {resource: dict(entry) for (resource, entry)
+                              in self.resources.items()},
+                'cases': [{'case': name, 'seconds': seconds, 'runs': runs}
+                          for (name, (seconds, runs)) in slowest]}
+
+    def report(self, timer):
+        """Get lines reporting the profile and the phases of a
+        PhaseTimer"""
+        data = self.data(timer)
+        lines = ["Profile:"]
+
+        for phase in data['phases']:
+            line = "  %-24s %10.1f ms" % (phase['phase'],
+                                          phase['seconds'] * 1000)
+            if phase['peak'] is not None:
+                line += " %10.1f MiB peak" % (phase['peak'] / 2 ** 20)
+            lines.append(line)
+
+        lines.append("Within the run, over all resources:")
+        for (phase, entry) in sorted(data['run'].items(),
+                                     key=lambda item: -item[1]['seconds']):
+            lines.append("  %-24s %10.1f ms %8d times" %
+                         (phase, entry['seconds'] * 1000, entry['count']))
+
+        lines.append("Resources:")
+        for (resource, entry) in sorted(data['resources'].items()):
+            lines.append("  %-24s busy %.1f s, %d cases, spawn %.1f ms, "
+                         "parsing %.1f ms" %
+                         (resource, entry['busy'], entry['cases'],
+                          entry['spawn'] * 1000, entry['parse'] * 1000))
+
+        lines.append("Slowest cases:")
+        for case in data['cases'][:self.top]:
+            lines.append("  %-24s %8.2f s over %d runs" %
+                         (case['case'], case['seconds'], case['runs']))
+
+        return lines
+
+    def save(self, file, timer):
+        import json
+        with open(file, 'w') as f:
+            json.dump(self.data(timer), f, indent=1, sort_keys=True)
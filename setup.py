@@ -1,14 +1,38 @@
 #!/usr/bin/python3
 
+import os
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+
+class build_py_with_tables(build_py):
+    """Generate the TAP parser tables so that they are installed
+    with the package instead of being built on first use"""
+
+    def run(self):
+        # Fail rather than install a package which builds the tables
+        # on every start where it cannot write them
+        from mistest.tap import Parser
+        Parser.build_tables()
+
+        tables = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'mistest', 'parsetab.py')
+        if not os.path.isfile(tables):
+            raise SystemExit("error: could not generate " + tables)
+
+        build_py.run(self)
+
+
 setup(
     name = "mistest",
     version = "0.1",
     packages = ['mistest'],
+    cmdclass = {'build_py': build_py_with_tables},
 
     entry_points = {
         'console_scripts': [
-            'mistest = mistest:main'
+            'mistest = mistest:main',
+            'mistest-agent = mistest.agent:main'
         ]
     },
 
@@ -16,6 +40,9 @@ setup(
     # installed or upgraded on the target machine
     install_requires = ['ply >= 3.4'],
 
+    # Aggregates repeated runs of cases with vectorized operations
+    extras_require = {'numpy': ['numpy']},
+
     # metadata for upload to PyPI
     author = "Nils Carlson",
     author_email = "pyssling@ludd.ltu.se",